@@ -0,0 +1,327 @@
+from VMCode import (PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL,
+                    CONSTANT, ARGUMENT, LOCAL, THIS, THAT, POINTER, TEMP,
+                    ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT)
+
+# Base pointer symbols of the segments addressed through one
+BASE_SYMBOLS = {LOCAL: 'LCL', ARGUMENT: 'ARG', THIS: 'THIS', THAT: 'THAT'}
+
+# D = x <op> y with x in M, y in D, for the binary commands that need no jump
+BINARY_COMPUTATIONS = {ADD: 'M+D', SUB: 'M-D', AND: 'D&M', OR: 'D|M'}
+
+# Jump that is taken when x <cmp> y, given D = x - y. For gt and lt, x - y
+# can overflow, so it is only used when x and y have the same sign.
+COMPARISON_JUMPS = {EQ: 'JEQ', GT: 'JGT', LT: 'JLT'}
+NEGATED_JUMPS = {EQ: 'JNE', GT: 'JLE', LT: 'JGE'}
+
+# Indexes up to this are reached with repeated A=A+1 instead of an @index add
+SMALL_INDEX = 3
+
+# Shared routines: call sites jump here instead of inlining the sequence
+CALL_ROUTINE = '$$CALL'
+RETURN_ROUTINE = '$$RETURN'
+COMPARE_ROUTINES = {EQ: '$$EQ', GT: '$$GT', LT: '$$LT'}
+
+# Scope of the return label of the bootstrap's call
+BOOTSTRAP = '$$BOOTSTRAP'
+
+# Every push ends with storing D at the top of the stack
+PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+POP_D = ['@SP', 'AM=M-1', 'D=M']
+
+
+class AsmWriter:
+    """
+    Lowers VM functions (VMCode Instructions) straight to Hack assembly,
+    for the whole program at once, without going through .vm text.
+
+    Calls, returns and eq/gt/lt jump to shared routines written once after
+    the bootstrap, instead of repeating their sequences at every use. Common
+    combinations get specialized sequences: a push feeding a pop or a binary
+    command skips the stack, a comparison feeding if-goto jumps directly, and
+    constant 0/1 and small segment indexes use Hack's built-in constants.
+    """
+
+    def __init__(self, output_file, lowered=None):
+        """
+        :param output_file: Path of the .asm file, or None to keep the output
+                            in memory only (see getvalue())
+        :param lowered: Optional dict, kept by the caller across writers, of
+                        function name -> (VMFunction, its lines); a function
+                        object found there is copied instead of lowered again
+        """
+        self.output_file = output_file
+        self.lowered = lowered
+        self.lines = []
+        # For return and comparison labels, unique within each function
+        self.label_counter = 0
+        # Class (file) name and function name of the function being written,
+        # for static symbols and label scoping
+        self.class_name = None
+        self.function_name = None
+
+    # ---------------------------------------------------------
+    # Program layout
+    # ---------------------------------------------------------
+    def write_bootstrap(self, entry='Sys.init'):
+        """
+        SP = 256, then call entry; if it ever returns, loop forever.
+        Also writes the shared routines, so it must come first.
+        """
+        self.function_name = BOOTSTRAP
+        self.lines += ['@256', 'D=A', '@SP', 'M=D']
+        self.write_call(entry, 0)
+        self.lines += ['($$HALT)', '@$$HALT', '0;JMP']
+        self.write_routines()
+
+    def write_routines(self):
+        lines = self.lines
+        # CALL_ROUTINE: D = return address, R13 = nArgs, R14 = callee
+        lines += [f'({CALL_ROUTINE})'] + PUSH_D
+        for pointer in ('LCL', 'ARG', 'THIS', 'THAT'):
+            lines += [f'@{pointer}', 'D=M'] + PUSH_D
+        lines += ['@SP', 'D=M', '@LCL', 'M=D',  # LCL = SP
+                  '@5', 'D=D-A', '@R13', 'D=D-M', '@ARG', 'M=D',  # ARG = SP - 5 - nArgs
+                  '@R14', 'A=M', '0;JMP']
+
+        # RETURN_ROUTINE: the frame is at LCL
+        lines += [f'({RETURN_ROUTINE})',
+                  '@5', 'D=A', '@LCL', 'A=M-D', 'D=M', '@R14', 'M=D',  # R14 = return address
+                  '@SP', 'AM=M-1', 'D=M', '@ARG', 'A=M', 'M=D',  # *ARG = return value
+                  'D=A+1', '@SP', 'M=D',  # SP = ARG + 1
+                  '@LCL', 'D=M', '@R13', 'AM=D-1']  # R13 = LCL - 1
+        for pointer in ('THAT', 'THIS', 'ARG', 'LCL'):
+            lines += ['D=M', f'@{pointer}', 'M=D', '@R13', 'AM=M-1']
+        lines += ['@R14', 'A=M', '0;JMP']
+
+        # COMPARE_ROUTINES: D = return address; replaces x, y with x <cmp> y
+        for command, routine in COMPARE_ROUTINES.items():
+            true, done = f'{routine}.TRUE', f'{routine}.DONE'
+            lines += [f'({routine})', '@R15', 'M=D']
+            if command == EQ:
+                lines += ['@SP', 'AM=M-1', 'D=M', 'A=A-1', 'D=M-D', f'@{true}', 'D;JEQ']
+            else:
+                x_negative, subtract = f'{routine}.XNEG', f'{routine}.SUB'
+                # x and y of different signs: x > y exactly when x >= 0
+                x_greater = true if command == GT else done + '.FALSE'
+                x_less = true if command == LT else done + '.FALSE'
+                lines += ['@SP', 'M=M-1', 'A=M-1', 'D=M',  # y popped, D = x
+                          f'@{x_negative}', 'D;JLT',
+                          '@SP', 'A=M', 'D=M', f'@{subtract}', 'D;JGE',  # x >= 0 > y
+                          f'@{x_greater}', '0;JMP',
+                          f'({x_negative})', '@SP', 'A=M', 'D=M', f'@{subtract}', 'D;JLT',  # x < 0 <= y
+                          f'@{x_less}', '0;JMP',
+                          f'({subtract})', '@SP', 'A=M', 'D=M', 'A=A-1', 'D=M-D',
+                          f'@{true}', f'D;{COMPARISON_JUMPS[command]}',
+                          f'({done}.FALSE)']
+            lines += ['@SP', 'A=M-1', 'M=0', f'@{done}', '0;JMP',
+                      f'({true})', '@SP', 'A=M-1', 'M=-1',
+                      f'({done})', '@R15', 'A=M', '0;JMP']
+
+    def write_function(self, function):
+        """ Writes a VMFunction: its entry label, zeroed locals, and its code. """
+        if self.lowered is not None:
+            lowered = self.lowered.get(function.name)
+            if lowered is not None and lowered[0] is function:
+                self.lines += lowered[1]
+                return
+        # Everything below depends on the function alone, labels included
+        start = len(self.lines)
+        self.function_name = function.name
+        self.class_name = function.name.split('.')[0]
+        self.label_counter = 0
+        lines = self.lines
+        lines.append(f'({function.name})')
+        if function.n_locals:
+            lines += ['@SP', 'A=M']
+            for i in range(function.n_locals):
+                lines.append('M=0')
+                lines.append('A=A+1')
+            lines += ['D=A', '@SP', 'M=D']
+
+        code = function.code
+        i = 0
+        while i < len(code):
+            i += self.write_instructions(code, i)
+        if self.lowered is not None:
+            self.lowered[function.name] = (function, self.lines[start:])
+
+    def getvalue(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def close(self):
+        if self.output_file is not None:
+            with open(self.output_file, 'w') as f:
+                f.write(self.getvalue())
+
+    # ---------------------------------------------------------
+    # Instructions
+    # ---------------------------------------------------------
+    def write_instructions(self, code, i):
+        """
+        Writes code[i], or a specialized sequence for code[i] together with
+        the instructions after it.
+        :return: Number of instructions written
+        """
+        instruction = code[i]
+        op = instruction.op
+        following = code[i + 1] if i + 1 < len(code) else None
+        after = code[i + 2] if i + 2 < len(code) else None
+
+        if op == PUSH:
+            if following is not None and following.op == POP and self.write_move(instruction, following):
+                return 2
+            if following is not None and following.op == ARITHMETIC:
+                command = following.arg1
+                if command in BINARY_COMPUTATIONS:
+                    self.write_binary_with(instruction, command)
+                    return 2
+            self.write_push(instruction)
+            return 1
+        if op == POP:
+            self.write_pop(instruction)
+            return 1
+        if op == ARITHMETIC:
+            command = instruction.arg1
+            if command in COMPARISON_JUMPS and following is not None:
+                if following.op == IF_GOTO:
+                    self.write_compare_jump(command, False, following.arg1)
+                    return 2
+                if (following.op == ARITHMETIC and following.arg1 == NOT
+                        and after is not None and after.op == IF_GOTO):
+                    self.write_compare_jump(command, True, after.arg1)
+                    return 3
+            self.write_arithmetic(command)
+            return 1
+        if op == LABEL:
+            self.lines.append(f'({self.label(instruction.arg1)})')
+        elif op == GOTO:
+            self.lines += [f'@{self.label(instruction.arg1)}', '0;JMP']
+        elif op == IF_GOTO:
+            self.lines += POP_D + [f'@{self.label(instruction.arg1)}', 'D;JNE']
+        elif op == CALL:
+            self.write_call(instruction.arg1, instruction.arg2)
+        else:  # RETURN
+            self.lines += [f'@{RETURN_ROUTINE}', '0;JMP']
+        return 1
+
+    def label(self, name):
+        return f'{self.function_name}${name}'
+
+    def static_symbol(self, index):
+        return f'{self.class_name}.{index}'
+
+    def fixed_address(self, segment, index):
+        """ The @ operand of a temp, pointer or static slot. """
+        if segment == TEMP:
+            return f'R{5 + index}'
+        if segment == POINTER:
+            return 'THAT' if index else 'THIS'
+        return self.static_symbol(index)
+
+    def load_d(self, instruction):
+        """ Lines that set D to the value a push instruction would push. """
+        segment, index = instruction.arg1, instruction.arg2
+        if segment == CONSTANT:
+            if index in (0, 1):
+                return [f'D={index}']
+            return [f'@{index}', 'D=A']
+        if segment in BASE_SYMBOLS:
+            return self.address_a(segment, index) + ['D=M']
+        return [f'@{self.fixed_address(segment, index)}', 'D=M']
+
+    def address_a(self, segment, index):
+        """ Lines that set A to the address of a slot of a pointer-based segment. """
+        base = BASE_SYMBOLS[segment]
+        if index <= SMALL_INDEX:
+            return [f'@{base}', 'A=M'] + ['A=A+1'] * index
+        return [f'@{index}', 'D=A', f'@{base}', 'A=D+M']
+
+    def write_push(self, instruction):
+        if instruction.arg1 == CONSTANT and instruction.arg2 in (0, 1):
+            self.lines += ['@SP', 'AM=M+1', 'A=A-1', f'M={instruction.arg2}']
+            return
+        self.lines += self.load_d(instruction) + PUSH_D
+
+    def store_d(self, instruction):
+        """ Lines that store D where a pop instruction would; may use R13. """
+        segment, index = instruction.arg1, instruction.arg2
+        if segment in BASE_SYMBOLS:
+            if index <= SMALL_INDEX:
+                # address_a leaves D alone for these
+                return self.address_a(segment, index) + ['M=D']
+            return ['@R13', 'M=D', f'@{index}', 'D=A', f'@{BASE_SYMBOLS[segment]}', 'D=D+M',
+                    '@R14', 'M=D', '@R13', 'D=M', '@R14', 'A=M', 'M=D']
+        return [f'@{self.fixed_address(segment, index)}', 'M=D']
+
+    def write_pop(self, instruction):
+        self.lines += POP_D + self.store_d(instruction)
+
+    def write_move(self, push, pop):
+        """ push X; pop Y without going through the stack. """
+        if pop.arg1 == CONSTANT:
+            return False
+        self.lines += self.load_d(push) + self.store_d(pop)
+        return True
+
+    def write_binary_with(self, push, command):
+        """ push X; add|sub|and|or applied to the top of the stack in place. """
+        if push.arg1 == CONSTANT and push.arg2 == 1 and command in (ADD, SUB):
+            self.lines += ['@SP', 'A=M-1', 'M=M+1' if command == ADD else 'M=M-1']
+            return
+        self.lines += self.load_d(push) + ['@SP', 'A=M-1', f'M={BINARY_COMPUTATIONS[command]}']
+
+    def write_arithmetic(self, command):
+        lines = self.lines
+        if command in BINARY_COMPUTATIONS:
+            lines += POP_D + ['A=A-1', f'M={BINARY_COMPUTATIONS[command]}']
+        elif command == NEG:
+            lines += ['@SP', 'A=M-1', 'M=-M']
+        elif command == NOT:
+            lines += ['@SP', 'A=M-1', 'M=!M']
+        else:
+            return_label = self.return_label()
+            lines += [f'@{return_label}', 'D=A', f'@{COMPARE_ROUTINES[command]}', '0;JMP',
+                      f'({return_label})']
+
+    def write_compare_jump(self, command, negated, label):
+        """ x; y; <cmp>; [not;] if-goto label  as conditional jumps, with nothing pushed. """
+        target = self.label(label)
+        jumps = NEGATED_JUMPS if negated else COMPARISON_JUMPS
+        if command == EQ:
+            self.lines += POP_D + ['A=A-1', 'D=M-D', '@SP', 'M=M-1', f'@{target}', f'D;{jumps[EQ]}']
+            return
+
+        prefix = self.local_label('cmp')
+        x_negative, subtract, done = f'{prefix}.XNEG', f'{prefix}.SUB', f'{prefix}.END'
+        # x and y of different signs: x > y exactly when x >= 0
+        x_greater = target if (command == GT) != negated else done
+        x_less = target if (command == LT) != negated else done
+        # Both are popped; x stays at RAM[SP] and y at RAM[SP + 1]
+        self.lines += ['@SP', 'M=M-1', 'AM=M-1', 'D=M',
+                       f'@{x_negative}', 'D;JLT',
+                       '@SP', 'A=M+1', 'D=M', f'@{subtract}', 'D;JGE',  # x >= 0 > y
+                       f'@{x_greater}', '0;JMP',
+                       f'({x_negative})', '@SP', 'A=M+1', 'D=M', f'@{subtract}', 'D;JLT',  # x < 0 <= y
+                       f'@{x_less}', '0;JMP',
+                       f'({subtract})', '@SP', 'A=M', 'D=M', 'A=A+1', 'D=D-M',
+                       f'@{target}', f'D;{jumps[command]}',
+                       f'({done})']
+
+    def local_label(self, kind):
+        """ A new label for the function being written, e.g. Main.main$ret.3 """
+        self.label_counter += 1
+        return f'{self.function_name}${kind}.{self.label_counter}'
+
+    def return_label(self):
+        return self.local_label('ret')
+
+    def write_call(self, name, n_args):
+        return_label = self.return_label()
+        lines = self.lines
+        if n_args in (0, 1):
+            lines += ['@R13', f'M={n_args}']
+        else:
+            lines += [f'@{n_args}', 'D=A', '@R13', 'M=D']
+        lines += [f'@{name}', 'D=A', '@R14', 'M=D',
+                  f'@{return_label}', 'D=A', f'@{CALL_ROUTINE}', '0;JMP',
+                  f'({return_label})']
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+
+
+def file_stat(path):
+    """ [size, mtime in ns] of a file, or None if it does not exist. """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def file_hash(path):
+    """ SHA-256 hex digest of a file's contents. """
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class BuildCache:
+    """
+    A persistent build manifest (.jackcache) recording, for each compiled
+    .jack file, the hash of its source and of the .vm file written for it.
+    A file whose source and output still match the manifest, compiled by the
+    same compiler version with the same options, does not need recompiling.
+    """
+    MANIFEST_NAME = '.jackcache'
+
+    def __init__(self, directory, key):
+        """
+        Load the manifest kept in directory.
+        :param directory: Directory holding the .jack files and the manifest
+        :param key: Compiler version and output options; a manifest written
+                    under a different key is discarded
+        """
+        self.path = os.path.join(directory, self.MANIFEST_NAME)
+        self.key = key
+        self.files = {}
+
+        try:
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(manifest, dict) and manifest.get('key') == key:
+            self.files = manifest.get('files', {})
+
+    def is_fresh(self, jack_file, vm_file):
+        """
+        Returns True if jack_file is unchanged since its recorded build and
+        vm_file is still the output written then.
+        """
+        entry = self.files.get(os.path.basename(jack_file))
+        if entry is None:
+            return False
+        return (self._matches(jack_file, entry['source'], entry['source_stat'])
+                and self._matches(vm_file, entry['output'], entry['output_stat']))
+
+    def entry(self, jack_file, vm_file):
+        """
+        Returns the manifest entry for a freshly compiled jack_file.
+        """
+        return {
+            'source': file_hash(jack_file),
+            'source_stat': file_stat(jack_file),
+            'output': file_hash(vm_file),
+            'output_stat': file_stat(vm_file),
+        }
+
+    def update(self, jack_file, entry):
+        """ Record entry (from entry()) for jack_file. """
+        self.files[os.path.basename(jack_file)] = entry
+
+    def forget(self, jack_file):
+        """ Drop jack_file from the manifest, e.g. after a failed compile. """
+        self.files.pop(os.path.basename(jack_file), None)
+
+    def save(self):
+        """
+        Write the manifest back, replacing the old one atomically.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            # json.dumps (unlike json.dump, or an indent) uses the C encoder
+            f.write(json.dumps({'key': self.key, 'files': self.files}, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+    def _matches(self, path, digest, stat):
+        """
+        Compare a file against its recorded hash. An unchanged size and
+        mtime is taken as unchanged content, so the hash is only computed
+        for files that were touched.
+        """
+        current_stat = file_stat(path)
+        if current_stat is None:
+            return False
+        if current_stat == stat:
+            return True
+        return file_hash(path) == digest
@@ -1,8 +1,101 @@
 import os
-from JackTokenizer import JackTokenizer  # from your Project 10
-from SymbolTable import SymbolTable  # from your Project 11
+from JackTokenizer import TOKENIZER_MODES  # from your Project 10
+from SymbolTable import Symbol, SymbolTable  # from your Project 11
 from typing import Optional
-from VMWriter import VMWriter
+from VMCode import (Instruction, PUSH, POP, ARITHMETIC, LABEL, IF_GOTO, CALL, CONSTANT, STATIC,
+                    POINTER, TEMP, ADD, SUB, AND, NEG, NOT, EQ, GT, LT, to_word)
+from VMOptimizer import peephole, self_tail_calls
+from VMWriter import IRWriter, VMWriter
+
+
+def fold_binary(op: str, x: int, y: int) -> Optional[int]:
+    """
+    Evaluates 'x op y' the way the VM (and Math.multiply/Math.divide) would
+    at run time. Returns None when that is not safe to do at compile time.
+    """
+    if op == '+':
+        return to_word(x + y)
+    elif op == '-':
+        return to_word(x - y)
+    elif op == '*':
+        return to_word(x * y)
+    elif op == '/':
+        # Leave division by zero (a run-time error) and the -32768 edge
+        # cases to Math.divide
+        if y == 0 or x == -32768 or y == -32768:
+            return None
+        quotient = abs(x) // abs(y)
+        return to_word(quotient if (x < 0) == (y < 0) else -quotient)
+    elif op == '&':
+        return x & y
+    elif op == '|':
+        return x | y
+    elif op == '<':
+        return -1 if x < y else 0
+    elif op == '>':
+        return -1 if x > y else 0
+    elif op == '=':
+        return -1 if x == y else 0
+    return None
+
+
+# Longest add chain (in VM instructions, beyond the operand itself) that
+# replaces a call to Math.multiply
+MAX_MULTIPLY_CHAIN = 32
+
+# Size of the VM's temp segment, which holds the arguments of an inlined call
+TEMP_SIZE = 8
+
+
+def is_pure(code) -> bool:
+    """
+    True if the Instructions only compute a value: no calls or stores that
+    could have side effects (setting 'that' for an array read is harmless).
+    """
+    return all(instruction.op in (PUSH, ARITHMETIC)
+               or (instruction.op == POP and instruction.arg1 == POINTER and instruction.arg2 == 1)
+               for instruction in code)
+
+
+def multiply_chain(operand, factor: int):
+    """
+    Returns Instructions computing (operand * factor) with adds instead of
+    Math.multiply, or None if that would be longer than MAX_MULTIPLY_CHAIN.
+    A single push is simply repeated; anything else is evaluated once into
+    temp 1. temp 2 holds the running product while it is doubled.
+    """
+    if factor == 0:
+        if is_pure(operand):
+            return [Instruction(PUSH, CONSTANT, 0)]
+        return operand + [Instruction(PUSH, CONSTANT, 0), Instruction(ARITHMETIC, AND)]
+    if factor == -32768:
+        return None
+
+    if len(operand) == 1 and operand[0].op == PUSH:
+        x = operand[0]
+        chain = [x]
+    else:
+        x = Instruction(PUSH, TEMP, 1)
+        chain = operand + [Instruction(POP, TEMP, 1), x]
+
+    # Left-to-right binary method: double for every bit after the top one,
+    # and add x for every set bit
+    first_doubling = True
+    for bit in bin(abs(factor))[3:]:
+        if first_doubling:
+            chain += [x, Instruction(ARITHMETIC, ADD)]
+            first_doubling = False
+        else:
+            chain += [Instruction(POP, TEMP, 2), Instruction(PUSH, TEMP, 2),
+                      Instruction(PUSH, TEMP, 2), Instruction(ARITHMETIC, ADD)]
+        if bit == '1':
+            chain += [x, Instruction(ARITHMETIC, ADD)]
+    if factor < 0:
+        chain.append(Instruction(ARITHMETIC, NEG))
+
+    if len(chain) - len(operand) > MAX_MULTIPLY_CHAIN:
+        return None
+    return chain
 
 
 class CompilationEngine:
@@ -11,51 +104,129 @@ class CompilationEngine:
     It parses the .jack file (via a JackTokenizer) and writes .vm code.
     """
 
-    def __init__(self, input_file_path: str, output_vm_path: str):
+    def __init__(self, input_file_path: str, output_vm_path: Optional[str],
+                 tokenizer_mode: str = 'eager', buffered: bool = False, ir: bool = False,
+                 optimizations=(), program_index=None):
         """
         Creates a new compilation engine with:
-          - a tokenizer (initialized on input_file_path)
+          - a tokenizer (initialized on input_file_path, see TOKENIZER_MODES)
           - a symbol table
-          - a VMWriter (writing to output_vm_path)
+          - a VMWriter (writing to output_vm_path, or kept in memory if it is
+            None; buffered writes the file in one go on close()), or with
+            ir an IRWriter that keeps the code as Instructions until close()
+
+        optimizations names the passes to run (e.g. 'peephole'); they work on
+        the IRWriter's Instructions, so any optimization implies ir.
+
+        program_index is a ProgramIndex of the whole program's subroutine
+        signatures; without one, calls are lowered from this class alone.
         """
         # Initialize tokenizer
-        self.tokenizer = JackTokenizer(input_file_path)
+        self.tokenizer = TOKENIZER_MODES[tokenizer_mode](input_file_path)
         self.symbol_table = SymbolTable()
-        self.vm_writer = VMWriter(output_vm_path)
+        self.optimizations = frozenset(optimizations)
+        if ir or self.optimizations:
+            self.vm_writer = IRWriter(output_vm_path)
+        else:
+            self.vm_writer = VMWriter(output_vm_path, buffered)
 
         self.class_name = None
+        self.program_index = program_index
 
         # We'll keep counters for generating unique labels in if/while statements.
         self.if_label_counter = 0
         self.while_label_counter = 0
 
+        # Counters reported by the optimizations, e.g. {'removed': 12}
+        self.stats = {}
+        if 'inline' in self.optimizations:
+            self.stats['inlined'] = 0
+        if 'tailcalls' in self.optimizations:
+            self.stats['tailcalls'] = 0
+
+        # With the 'strings' optimization: string literal -> static slot, the
+        # first static slot after the class's own statics (a "built" flag
+        # followed by one slot per literal), and whether the subroutine being
+        # compiled uses the pool
+        self.string_pool = {}
+        self.string_pool_base = None
+        self.uses_string_pool = False
+
         # Prime the tokenizer if needed:
         # (Depending on your tokenizer, you might need to self.tokenizer.advance() here.)
         # If your tokenizer auto-advances, skip this.
 
     def close(self):
-        """ Close the VMWriter output. """
+        """ Close the VMWriter output and release the tokenizer's source. """
         self.vm_writer.close()
+        self.tokenizer.close()
 
     # ---------------------------------------------------------
     # Helpers
     # ---------------------------------------------------------
 
-    def kind_to_segment(self, kind: Optional[str]) -> Optional[str]:
+    def variable(self, name: str) -> Symbol:
+        """
+        The symbol table entry for a variable being read or assigned.
+        Raises ValueError for a name that is not defined.
+        """
+        symbol = self.symbol_table.resolve(name)
+        if symbol is None:
+            raise ValueError(f"{self.class_name}: undefined variable '{name}'")
+        return symbol
+
+    def write_constant(self, value: int):
+        """
+        Push any signed 16-bit value: 'push constant' only takes 0..32767.
+        """
+        if value >= 0:
+            self.vm_writer.writePush("constant", value)
+        elif value == -32768:
+            self.vm_writer.writePush("constant", 32767)
+            self.vm_writer.writeArithmetic("not")
+        else:
+            self.vm_writer.writePush("constant", -value)
+            self.vm_writer.writeArithmetic("neg")
+
+    def code_mark(self) -> int:
         """
-        Convert a symbol table 'kind' to a VM segment name.
-        Returns None if not applicable.
+        The position of the next Instruction in the current function (IR only),
+        for marking where a term or expression starts.
         """
-        if kind == 'static':
-            return 'static'
-        elif kind == 'field':
-            return 'this'
-        elif kind == 'arg':
-            return 'argument'
-        elif kind == 'var':
-            return 'local'
+        return len(self.vm_writer.code)
+
+    def constant_value(self, start: int, end: Optional[int] = None) -> Optional[int]:
+        """
+        If the Instructions from start to end (IR only) just push a constant,
+        as write_constant or 'true' would emit it, return its value.
+        """
+        region = self.vm_writer.code[start:end]
+        if not region or region[0].op != PUSH or region[0].arg1 != CONSTANT:
+            return None
+        value = region[0].arg2
+        if len(region) == 1:
+            return value
+        if len(region) == 2 and region[1].op == ARITHMETIC:
+            if region[1].arg1 == NEG:
+                return to_word(-value)
+            if region[1].arg1 == NOT:
+                return ~value
         return None
 
+    def is_boolean(self, start: int) -> bool:
+        """
+        True if the Instructions from start on (IR only) always leave 0 or -1:
+        a comparison, possibly negated, or the constant true/false.
+        """
+        value = self.constant_value(start)
+        if value is not None:
+            return value in (0, -1)
+        code = self.vm_writer.code
+        i = len(code) - 1
+        while i >= start and code[i].op == ARITHMETIC and code[i].arg1 == NOT:
+            i -= 1
+        return i >= start and code[i].op == ARITHMETIC and code[i].arg1 in (EQ, GT, LT)
+
     def eat(self, token_value=None):
         """
         Utility method: Check the current token and advance.
@@ -104,6 +275,20 @@ class CompilationEngine:
         if self.tokenizer.token_type() == 'SYMBOL' and self.tokenizer.symbol() == '}':
             self.eat()  # skip '}'
 
+        if self.string_pool:
+            self.compile_string_pool()
+        self.optimize()
+
+    def optimize(self):
+        """
+        Runs the requested passes over each compiled function's Instructions.
+        """
+        if 'peephole' in self.optimizations:
+            removed = 0
+            for function in self.vm_writer.functions:
+                removed += peephole(function)
+            self.stats['removed'] = removed
+
     # ---------------------------------------------------------
     # 2) compileClassVarDec
     # ---------------------------------------------------------
@@ -223,7 +408,13 @@ class CompilationEngine:
             self.vm_writer.writePop("pointer", 0)
 
         # compile statements
+        self.uses_string_pool = False
         self.compile_statements()
+        if self.uses_string_pool:
+            self.insert_string_pool_check()
+        if 'tailcalls' in self.optimizations and subroutine_type != 'constructor':
+            n_args = self.symbol_table.varCount('arg')
+            self.stats['tailcalls'] += self_tail_calls(self.vm_writer.functions[-1], n_args)
 
         # '}'
         if self.tokenizer.token_type() == 'SYMBOL' and self.tokenizer.symbol() == '}':
@@ -287,9 +478,8 @@ class CompilationEngine:
         self.eat()  # skip 'let'
 
         var_name = self.tokenizer.currentToken
-        kind = self.symbol_table.kindOf(var_name)
-        index = self.symbol_table.indexOf(var_name)
-        segment = self.kind_to_segment(kind)
+        symbol = self.variable(var_name)
+        segment, index = symbol.segment, symbol.index
 
         self.eat()  # skip varName
 
@@ -341,6 +531,10 @@ class CompilationEngine:
         # skip '('
         self.eat()
 
+        lower = 'branches' in self.optimizations
+        if lower:
+            condition_start = self.code_mark()
+
         # compile expression => pushes result (true=>-1, false=>0)
         self.compile_expression()
 
@@ -349,12 +543,25 @@ class CompilationEngine:
 
         label_false = f"IF_FALSE{self.if_label_counter}"
         label_end = f"IF_END{self.if_label_counter}"
+        label_true = f"IF_TRUE{self.if_label_counter}"
         self.if_label_counter += 1
 
-        # We want to jump to IF_FALSE if expression == false
-        # expression==true => top of stack is non-zero => "if-goto" jumps if not 0
-        self.vm_writer.writeArithmetic("not")  # not the value => 0 if true
-        self.vm_writer.writeIf(label_false)
+        if lower:
+            value = self.constant_value(condition_start)
+            if value is not None:
+                del self.vm_writer.code[condition_start:]
+                self.compile_constant_if(value == -1)
+                return
+            last = self.vm_writer.code[-1]
+            if last.op == ARITHMETIC and last.arg1 in (LT, GT):
+                self.compile_if_on_true(label_false, label_end, label_true)
+                return
+            self.write_branch_if_false(condition_start, label_false)
+        else:
+            # We want to jump to IF_FALSE if expression == false
+            # expression==true => top of stack is non-zero => "if-goto" jumps if not 0
+            self.vm_writer.writeArithmetic("not")  # not the value => 0 if true
+            self.vm_writer.writeIf(label_false)
 
         # skip '{'
         self.eat()
@@ -383,6 +590,84 @@ class CompilationEngine:
             # no else => just place label_false
             self.vm_writer.writeLabel(label_false)
 
+    # ---------------------------------------------------------
+    # Branch lowering ('branches' optimization, IR only)
+    # ---------------------------------------------------------
+    # The plain code jumps to the false branch with 'not; if-goto', which is
+    # taken unless the condition is exactly -1 (true). Everything here keeps
+    # that meaning.
+
+    def write_branch_if_false(self, condition_start: int, label: str):
+        """
+        Jump to label if the condition from condition_start on is false.
+        Trailing 'not's of the condition cancel against the branch's own
+        'not' in pairs, and 'eq; not; if-goto' becomes 'sub; if-goto'
+        (x != y exactly when x - y != 0).
+        """
+        code = self.vm_writer.code
+        negations = 1
+        while len(code) - condition_start > 1 and code[-1].op == ARITHMETIC and code[-1].arg1 == NOT:
+            code.pop()
+            negations += 1
+        if negations % 2 == 1:
+            if code[-1].op == ARITHMETIC and code[-1].arg1 == EQ:
+                code[-1] = Instruction(ARITHMETIC, SUB)
+            else:
+                self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writeIf(label)
+
+    def compile_statements_block(self, live: bool):
+        """
+        Compile '{' statements '}', dropping the code again unless live.
+        """
+        start = self.code_mark()
+        # skip '{'
+        self.eat()
+        self.compile_statements()
+        # skip '}'
+        self.eat()
+        if not live:
+            del self.vm_writer.code[start:]
+
+    def compile_constant_if(self, is_true: bool):
+        """
+        The rest of an if statement whose condition is a constant: only the
+        arm that runs is kept, with no test or labels.
+        """
+        self.compile_statements_block(is_true)
+        if self.tokenizer.token_type() == 'KEYWORD' and self.tokenizer.keyWord() == 'else':
+            self.eat()  # skip 'else'
+            self.compile_statements_block(not is_true)
+
+    def compile_if_on_true(self, label_false: str, label_end: str, label_true: str):
+        """
+        The rest of an if statement whose condition is a comparison (0 or -1):
+        with an else arm, branch to the then arm on the condition itself,
+            if-goto label_true; else arm; goto label_end;
+            label label_true; then arm; label label_end
+        which needs no 'not'. Without one the plain layout is kept.
+        """
+        code = self.vm_writer.code
+        then_start = self.code_mark()
+        self.compile_statements_block(True)
+        then_arm = code[then_start:]
+        del code[then_start:]
+
+        if not (self.tokenizer.token_type() == 'KEYWORD' and self.tokenizer.keyWord() == 'else'):
+            self.vm_writer.writeArithmetic("not")
+            self.vm_writer.writeIf(label_false)
+            code.extend(then_arm)
+            self.vm_writer.writeLabel(label_false)
+            return
+
+        self.vm_writer.writeIf(label_true)
+        self.eat()  # skip 'else'
+        self.compile_statements_block(True)
+        self.vm_writer.writeGoto(label_end)
+        self.vm_writer.writeLabel(label_true)
+        code.extend(then_arm)
+        self.vm_writer.writeLabel(label_end)
+
     # ---------------------------------------------------------
     # 8) compileWhile
     # ---------------------------------------------------------
@@ -394,10 +679,17 @@ class CompilationEngine:
 
         label_exp = f"WHILE_EXP{self.while_label_counter}"
         label_end = f"WHILE_END{self.while_label_counter}"
+        label_body = f"WHILE_BODY{self.while_label_counter}"
         self.while_label_counter += 1
 
-        # write label_exp
-        self.vm_writer.writeLabel(label_exp)
+        rotate = 'loops' in self.optimizations
+        lower = 'branches' in self.optimizations
+        if rotate or lower:
+            # label_exp is placed once we know which layout to use
+            condition_start = self.code_mark()
+        else:
+            # write label_exp
+            self.vm_writer.writeLabel(label_exp)
 
         # skip '('
         self.eat()
@@ -405,9 +697,24 @@ class CompilationEngine:
         # skip ')'
         self.eat()
 
-        # not the top => if-goto label_end if expression == false
-        self.vm_writer.writeArithmetic("not")
-        self.vm_writer.writeIf(label_end)
+        if lower:
+            value = self.constant_value(condition_start)
+            if value is not None:
+                del self.vm_writer.code[condition_start:]
+                self.compile_constant_while(value == -1, label_exp)
+                return
+        if rotate and self.is_boolean(condition_start):
+            self.compile_rotated_while_body(condition_start, label_exp, label_body)
+            return
+        if rotate or lower:
+            self.vm_writer.code.insert(condition_start, Instruction(LABEL, label_exp))
+
+        if lower:
+            self.write_branch_if_false(condition_start, label_end)
+        else:
+            # not the top => if-goto label_end if expression == false
+            self.vm_writer.writeArithmetic("not")
+            self.vm_writer.writeIf(label_end)
 
         # skip '{'
         self.eat()
@@ -420,6 +727,48 @@ class CompilationEngine:
         # label_end
         self.vm_writer.writeLabel(label_end)
 
+    def compile_constant_while(self, is_true: bool, label_exp: str):
+        """
+        The rest of a while loop whose condition is a constant (IR only):
+        'true' loops with no test at all, anything else never runs the body,
+        so no code is kept.
+        """
+        if is_true:
+            self.vm_writer.writeLabel(label_exp)
+        self.compile_statements_block(is_true)
+        if is_true:
+            self.vm_writer.writeGoto(label_exp)
+
+    def compile_rotated_while_body(self, condition_start: int, label_exp: str, label_body: str):
+        """
+        Lay the loop out with the test at the bottom (IR only):
+            goto label_exp
+            label label_body
+            statements
+            label label_exp
+            condition
+            if-goto label_body
+        One branch per iteration instead of if-goto + goto, and no 'not'.
+        Only used when the condition is 0 or -1 (see is_boolean), where
+        "non-zero" and "true" agree.
+        """
+        code = self.vm_writer.code
+        condition = code[condition_start:]
+        del code[condition_start:]
+
+        self.vm_writer.writeGoto(label_exp)
+        self.vm_writer.writeLabel(label_body)
+
+        # skip '{'
+        self.eat()
+        self.compile_statements()
+        # skip '}'
+        self.eat()
+
+        self.vm_writer.writeLabel(label_exp)
+        code.extend(condition)
+        self.vm_writer.writeIf(label_body)
+
     # ---------------------------------------------------------
     # 9) compileDo
     # ---------------------------------------------------------
@@ -449,15 +798,14 @@ class CompilationEngine:
         num_args = 0
 
         # check if identifier is a variable in symbol table
-        kind = self.symbol_table.kindOf(identifier)
+        symbol = self.symbol_table.resolve(identifier)
+        kind = symbol.kind if symbol is not None else None
         if kind is not None:
             # it's a variable => method call on some object
             # push that object reference
-            segment = self.kind_to_segment(kind)
-            index = self.symbol_table.indexOf(identifier)
-            self.vm_writer.writePush(segment, index)
+            self.vm_writer.writePush(symbol.segment, symbol.index)
             # the fullName we call will be TypeOfVar.subName
-            obj_type = self.symbol_table.typeOf(identifier)
+            obj_type = symbol.type
             is_method_call = True
         else:
             # might be a function in the same class or some other class
@@ -471,6 +819,10 @@ class CompilationEngine:
             self.eat()  # skip '.'
             subroutine_name = self.tokenizer.currentToken
             self.eat()  # skip subroutineName
+        elif self.is_own_function(identifier):
+            # "identifier(...)" naming a function or constructor of *this* class
+            subroutine_name = identifier
+            obj_type = self.class_name
         else:
             # no '.', so it's "identifier(...)"
             # means subroutine is in *this* class
@@ -502,7 +854,7 @@ class CompilationEngine:
             full_call_name = f"{obj_type}.{subroutine_name}"
 
         # now call
-        self.vm_writer.writeCall(full_call_name, n_expressions)
+        self.write_call(full_call_name, n_expressions, is_method_call)
 
     # ---------------------------------------------------------
     # 10) compileReturn
@@ -532,6 +884,9 @@ class CompilationEngine:
         """
         expression => term (op term)*
         """
+        fold = 'fold' in self.optimizations
+        if self.optimizations:
+            start = self.code_mark()
         self.compile_term()
 
         # while next token is an operator
@@ -539,8 +894,24 @@ class CompilationEngine:
                and self.tokenizer.symbol() in ['+', '-', '*', '/', '&', '|', '<', '>', '=']):
             op = self.tokenizer.symbol()
             self.eat()  # skip the operator
+            if self.optimizations:
+                rhs_start = self.code_mark()
             self.compile_term()
 
+            if fold:
+                # Jack has no precedence, so everything since start is the left operand
+                lhs = self.constant_value(start, rhs_start)
+                rhs = self.constant_value(rhs_start)
+                if lhs is not None and rhs is not None:
+                    value = fold_binary(op, lhs, rhs)
+                    if value is not None:
+                        del self.vm_writer.code[start:]
+                        self.write_constant(value)
+                        continue
+            if op in ('*', '/') and 'strength' in self.optimizations:
+                if self.reduce_strength(op, start, rhs_start):
+                    continue
+
             # handle the operator
             if op == '+':
                 self.vm_writer.writeArithmetic("add")
@@ -561,6 +932,36 @@ class CompilationEngine:
             elif op == '=':
                 self.vm_writer.writeArithmetic("eq")
 
+    def reduce_strength(self, op: str, start: int, rhs_start: int) -> bool:
+        """
+        Replaces 'x * c', 'c * x' and 'x / 1' for a constant c with cheaper
+        code than a Math.multiply/Math.divide call (IR only). The operands
+        are the Instructions from start to rhs_start and from rhs_start on.
+        Returns False, changing nothing, if it does not apply.
+        """
+        code = self.vm_writer.code
+        rhs = self.constant_value(rhs_start)
+        if op == '/':
+            if rhs != 1:
+                return False
+            del code[rhs_start:]
+            return True
+
+        if rhs is not None:
+            operand, factor = code[start:rhs_start], rhs
+        else:
+            factor = self.constant_value(start, rhs_start)
+            if factor is None:
+                return False
+            operand = code[rhs_start:]
+
+        chain = multiply_chain(operand, factor)
+        if chain is None:
+            return False
+        del code[start:]
+        code.extend(chain)
+        return True
+
     # ---------------------------------------------------------
     # 12) compileTerm
     # ---------------------------------------------------------
@@ -604,7 +1005,15 @@ class CompilationEngine:
                 # unary op
                 unary_op = sym
                 self.eat()
+                if 'fold' in self.optimizations:
+                    start = self.code_mark()
                 self.compile_term()
+                if 'fold' in self.optimizations:
+                    value = self.constant_value(start)
+                    if value is not None:
+                        del self.vm_writer.code[start:]
+                        self.write_constant(to_word(-value) if unary_op == '-' else ~value)
+                        return
                 if unary_op == '-':
                     self.vm_writer.writeArithmetic("neg")
                 else:  # '~'
@@ -619,12 +1028,10 @@ class CompilationEngine:
                 sym = self.tokenizer.symbol()
                 if sym == '[':
                     # array access
-                    kind = self.symbol_table.kindOf(name)
-                    index = self.symbol_table.indexOf(name)
-                    segment = self.kind_to_segment(kind)
+                    symbol = self.variable(name)
 
                     # push base address
-                    self.vm_writer.writePush(segment, index)
+                    self.vm_writer.writePush(symbol.segment, symbol.index)
                     self.eat()  # skip '['
                     self.compile_expression()
                     self.eat()  # skip ']'
@@ -639,16 +1046,12 @@ class CompilationEngine:
                     self._compile_subroutine_call_after_first(name)
                 else:
                     # just a varName
-                    kind = self.symbol_table.kindOf(name)
-                    index = self.symbol_table.indexOf(name)
-                    seg = self.kind_to_segment(kind)
-                    self.vm_writer.writePush(seg, index)
+                    symbol = self.variable(name)
+                    self.vm_writer.writePush(symbol.segment, symbol.index)
             else:
                 # just a varName
-                kind = self.symbol_table.kindOf(name)
-                index = self.symbol_table.indexOf(name)
-                seg = self.kind_to_segment(kind)
-                self.vm_writer.writePush(seg, index)
+                symbol = self.variable(name)
+                self.vm_writer.writePush(symbol.segment, symbol.index)
 
     def _compile_subroutine_call_after_first(self, first_identifier):
         """
@@ -656,13 +1059,12 @@ class CompilationEngine:
         We'll replicate the logic from compile_subroutine_call but we already have first_identifier.
         """
         num_args = 0
-        kind = self.symbol_table.kindOf(first_identifier)
+        symbol = self.symbol_table.resolve(first_identifier)
+        kind = symbol.kind if symbol is not None else None
         if kind is not None:
             # it's a variable => method call on that object
-            segment = self.kind_to_segment(kind)
-            index = self.symbol_table.indexOf(first_identifier)
-            self.vm_writer.writePush(segment, index)
-            obj_type = self.symbol_table.typeOf(first_identifier)
+            self.vm_writer.writePush(symbol.segment, symbol.index)
+            obj_type = symbol.type
             is_method_call = True
         else:
             # might be a function in same class or other class
@@ -674,6 +1076,10 @@ class CompilationEngine:
             self.eat()  # skip '.'
             subroutine_name = self.tokenizer.currentToken
             self.eat()
+        elif self.is_own_function(first_identifier):
+            # a function or constructor of this class, no 'this' to pass
+            subroutine_name = first_identifier
+            obj_type = self.class_name
         else:
             # no '.', so it's a method call on 'this'
             subroutine_name = first_identifier
@@ -698,7 +1104,102 @@ class CompilationEngine:
         else:
             full_name = f"{obj_type}.{subroutine_name}"
 
-        self.vm_writer.writeCall(full_name, n_expr)
+        self.write_call(full_name, n_expr, is_method_call)
+
+    def write_call(self, full_name: str, n_args: int, is_method_call: bool):
+        """
+        Writes 'call full_name n_args', or with the 'inline' optimization,
+        the callee's body in its place if the program index has it as trivial.
+        """
+        if 'inline' in self.optimizations and self.program_index is not None:
+            class_name, subroutine_name = full_name.split('.')
+            signature = self.program_index.lookup(class_name, subroutine_name)
+            if (signature is not None and signature.inline is not None
+                    and (signature.kind == 'method') == is_method_call
+                    and signature.arity + is_method_call == n_args
+                    and n_args <= TEMP_SIZE):
+                self.write_inline(signature.inline, n_args)
+                self.stats['inlined'] += 1
+                return
+        self.vm_writer.writeCall(full_name, n_args)
+
+    def write_inline(self, body, n_args: int):
+        """
+        Writes a trivial body (see ProgramIndex.trivial_body) over the n_args
+        arguments on the stack, leaving the value the call would return.
+        Arguments still needed are popped into temp <their index>; a method's
+        'this' goes to pointer 1, so its fields are read and written as 'that'.
+        """
+        if body[0] == 'return':
+            operand = body[1]
+            if operand[0] == 'argument':
+                # the argument we return may be the top one, already in place
+                if operand[1] == n_args - 1:
+                    if n_args > 1:
+                        self.vm_writer.writePop("temp", 0)
+                        for _ in range(n_args - 1):
+                            self.vm_writer.writePop("temp", 1)
+                        self.vm_writer.writePush("temp", 0)
+                    return
+                for index in reversed(range(n_args)):
+                    self.vm_writer.writePop("temp", index)
+                self.vm_writer.writePush("temp", operand[1])
+                return
+            if operand[0] == 'field':
+                # 'this' is argument 0, under the others
+                for _ in range(n_args - 1):
+                    self.vm_writer.writePop("temp", 0)
+                self.vm_writer.writePop("pointer", 1)
+                self.vm_writer.writePush("that", operand[1])
+                return
+            for _ in range(n_args):
+                self.vm_writer.writePop("temp", 0)
+            self.write_constant(operand[1])
+            return
+
+        # 'store': let field = operand; return;
+        field_index, operand = body[1], body[2]
+        if operand == ('argument', 0):
+            # let field = this: the receiver is also the value stored
+            for _ in range(n_args - 1):
+                self.vm_writer.writePop("temp", 0)
+            self.vm_writer.writePop("pointer", 1)
+            self.vm_writer.writePush("pointer", 1)
+        elif operand[0] == 'argument' and operand[1] == n_args - 1:
+            # the usual setter: the value is the top argument
+            self.vm_writer.writePop("temp", 0)
+            for _ in range(n_args - 2):
+                self.vm_writer.writePop("temp", 1)
+            self.vm_writer.writePop("pointer", 1)
+            self.vm_writer.writePush("temp", 0)
+        elif operand[0] == 'argument':
+            for index in reversed(range(1, n_args)):
+                self.vm_writer.writePop("temp", index)
+            self.vm_writer.writePop("pointer", 1)
+            self.vm_writer.writePush("temp", operand[1])
+        else:
+            for _ in range(n_args - 1):
+                self.vm_writer.writePop("temp", 0)
+            self.vm_writer.writePop("pointer", 1)
+            if operand[0] == 'field':
+                self.vm_writer.writePush("that", operand[1])
+            else:
+                self.write_constant(operand[1])
+        self.vm_writer.writePop("that", field_index)
+        # a void subroutine returns 0
+        self.vm_writer.writePush("constant", 0)
+
+    def is_own_function(self, subroutine_name):
+        """
+        True if the program index shows subroutine_name as a function or
+        constructor of this class, so an unqualified call to it takes no 'this'.
+        Without an index (or for a name it does not know) every unqualified
+        call is compiled as a method call, as before.
+        """
+        if self.program_index is None:
+            return False
+        signature = self.program_index.lookup(self.class_name, subroutine_name)
+        return signature is not None and signature.kind != 'method'
 
     # ---------------------------------------------------------
     # 13) compileExpressionList
@@ -733,7 +1234,17 @@ class CompilationEngine:
           then for each character c:
               push c's ascii
               call String.appendChar 2
+        With the 'strings' optimization we just push the literal's pool slot.
         """
+        if 'strings' in self.optimizations:
+            self.vm_writer.writePush("static", self.string_pool_slot(string_val))
+            self.uses_string_pool = True
+            return
+
+        self.build_string(string_val)
+
+    def build_string(self, string_val: str):
+        """ Emit the String.new/String.appendChar calls that build string_val. """
         length = len(string_val)
         # push length
         self.vm_writer.writePush("constant", length)
@@ -744,3 +1255,51 @@ class CompilationEngine:
         for ch in string_val:
             self.vm_writer.writePush("constant", ord(ch))  # ASCII code
             self.vm_writer.writeCall("String.appendChar", 2)
+
+    # ---------------------------------------------------------
+    # String pool ('strings' optimization)
+    # ---------------------------------------------------------
+    # Each distinct literal in the class is built once, by a generated
+    # "<Class>.$strings" function, into its own static slot. Every subroutine
+    # that uses a literal first calls that function unless the flag slot says
+    # the pool is already built. Note that a pooled literal is one shared
+    # String, so code that changes it changes every use of it.
+
+    def string_pool_name(self) -> str:
+        return f"{self.class_name}.$strings"
+
+    def string_pool_slot(self, string_val: str) -> int:
+        """ Return the static slot holding string_val, assigning one if needed. """
+        if self.string_pool_base is None:
+            # All class statics are declared before the first subroutine
+            self.string_pool_base = self.symbol_table.varCount('static')
+        if string_val not in self.string_pool:
+            self.string_pool[string_val] = self.string_pool_base + 1 + len(self.string_pool)
+        return self.string_pool[string_val]
+
+    def insert_string_pool_check(self):
+        """
+        Put 'build the pool unless it is built' at the top of the current
+        function (IR only).
+        """
+        flag = self.string_pool_base
+        ready = "STRING_POOL_READY"
+        self.vm_writer.code[0:0] = [
+            Instruction(PUSH, STATIC, flag),
+            Instruction(IF_GOTO, ready),
+            Instruction(CALL, self.string_pool_name(), 0),
+            Instruction(POP, TEMP, 0),
+            Instruction(LABEL, ready),
+        ]
+
+    def compile_string_pool(self):
+        """ Emit the function that builds every pooled literal and sets the flag. """
+        self.vm_writer.writeFunction(self.string_pool_name(), 0)
+        for string_val, slot in self.string_pool.items():
+            self.build_string(string_val)
+            self.vm_writer.writePop("static", slot)
+        self.vm_writer.writePush("constant", 0)
+        self.vm_writer.writeArithmetic("not")
+        self.vm_writer.writePop("static", self.string_pool_base)
+        self.vm_writer.writePush("constant", 0)
+        self.vm_writer.writeReturn()
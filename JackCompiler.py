@@ -1,60 +1,515 @@
+import argparse
+import cProfile
+import json
 import os
-from CompilationEngine import CompilationEngine
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from AsmWriter import AsmWriter
+from BuildCache import BuildCache, file_stat
+from CompilationEngine import CompilationEngine
+from JackTokenizer import TOKENIZER_MODES
+from Profiler import FileProfile
+from ProgramIndex import ProgramIndex
+from VMCode import CALL, parse, serialize
+from VMOptimizer import reachable_functions
+
+# Bump whenever the generated code changes, so cached outputs are rebuilt
+COMPILER_VERSION = '1.2'
+
+# Optimization passes that can be enabled one by one with --opt, and the
+# ones enabled by -O. 'strings' is left out of -O: it makes every use of a
+# string literal share one String, which changes programs that modify one.
+# 'shake' is left out too: it drops whatever the program's entry points do
+# not reach, so it does not suit a directory of library classes.
+OPTIMIZATIONS = ('branches', 'fold', 'inline', 'loops', 'peephole', 'shake', 'strength', 'strings',
+                 'tailcalls')
+DEFAULT_OPTIMIZATIONS = ('branches', 'fold', 'inline', 'loops', 'peephole', 'strength', 'tailcalls')
+
+# Where a Jack program starts; with 'shake', subroutines not reachable from
+# these (or from the extra roots given to JackCompiler) are dropped
+ENTRY_POINTS = ('Main.main', 'Sys.init')
+
+# What JackCompiler writes: a .vm file per class, or one Hack .asm file for
+# the whole program
+BACKENDS = ('vm', 'asm')
+
+# Seconds between two looks at the .jack files' mtime and size in watch mode
+WATCH_INTERVAL = 0.1
+
+# How each per-file stat from CompilationEngine.stats is reported
+STAT_DESCRIPTIONS = {
+    'removed': "VM instructions removed",
+    'inlined': "call sites inlined",
+    'dropped': "unreachable subroutines dropped",
+    'tailcalls': "self tail calls turned into jumps",
+}
 
 class JackCompiler:
-    def __init__(self, input_path):
+    def __init__(self, input_path, tokenizer_mode='eager', jobs=1, use_cache=True, optimizations=(),
+                 roots=(), profile=False, backend='vm'):
         """
         Initialize the analyzer with either a .jack file or a directory containing .jack files.
         :param input_path: Path to file or directory
+        :param tokenizer_mode: 'eager' builds each file's token list up front,
+                               'stream' scans lazily while compiling,
+                               'mmap' keeps token offsets into a memory-mapped file
+        :param jobs: Number of worker processes to compile files in (1 = serial)
+        :param use_cache: Skip files that are unchanged since the last build,
+                          as recorded in the directory's .jackcache manifest
+        :param optimizations: Names from OPTIMIZATIONS to apply
+        :param roots: Subroutine names ('Class.name') that 'shake' must keep,
+                      with whatever they call, besides ENTRY_POINTS
+        :param profile: Measure each file's compilation phases (see
+                        FileProfile) into self.profile_report; this compiles
+                        every file, serially, without the cache
+        :param backend: 'vm' writes a .vm file next to each .jack file; 'asm'
+                        writes the whole program, with the library .vm files
+                        of the directory (e.g. the OS), as one .asm file
+                        (see asm_file), recompiling every file
         """
         self.input_path = input_path
-        self.files_to_process = []
+        self.tokenizer_mode = tokenizer_mode
+        self.profile = profile
+        self.jobs = 1 if profile else jobs
+        self.optimizations = tuple(sorted(set(optimizations)))
+        self.roots = tuple(roots)
+        self.backend = backend
+        self.cache = None
+        self.program_index = None
+        # Per-file optimization stats from the last analyze(), e.g. {'Main.jack': {'removed': 12}}
+        self.stats = {}
+        # With profile, the measurements of the last analyze()
+        self.profile_report = None
+        # Kept between builds for watch(): the last try_process_file() result
+        # of each file, the parsed library .vm files ({path: (stat, VMFunctions)})
+        # and AsmWriter's lowered functions
+        self.results = {}
+        self.libraries = {}
+        self.lowered = {}
 
         # Check if input is a file or directory
         if os.path.isfile(input_path):
-            if input_path.endswith('.jack'):
-                self.files_to_process.append(input_path)
-            else:
+            if not input_path.endswith('.jack'):
                 raise ValueError(f"Input file must have .jack extension: {input_path}")
-        elif os.path.isdir(input_path):
-            # Get all .jack files in the directory
-            for file in os.listdir(input_path):
-                if file.endswith('.jack'):
-                    self.files_to_process.append(os.path.join(input_path, file))
-            if not self.files_to_process:
-                raise ValueError(f"No .jack files found in directory: {input_path}")
-        else:
+        elif not os.path.isdir(input_path):
             raise ValueError(f"Input path does not exist: {input_path}")
+        self.files_to_process = self.find_jack_files()
+        if not self.files_to_process:
+            raise ValueError(f"No .jack files found in directory: {input_path}")
+
+        self.directory = os.path.dirname(self.files_to_process[0]) or '.'
+        self.use_cache = use_cache and not profile
+        # With the 'asm' backend: Dir/Dir.asm for a directory, Main.asm for Main.jack
+        if os.path.isdir(input_path):
+            self.asm_file = os.path.join(self.directory, os.path.basename(os.path.abspath(input_path)) + '.asm')
+        else:
+            self.asm_file = input_path[:-5] + '.asm'
+        # Each file's output depends on the whole program: compile every
+        # file to memory, then write the output in one step
+        self.whole_program = backend == 'asm' or 'shake' in self.optimizations
+
+    def __getstate__(self):
+        # Worker processes only compile files: leave the state kept for
+        # linking and watching behind instead of pickling it for every task
+        state = self.__dict__.copy()
+        state.update(results={}, libraries={}, lowered={})
+        return state
+
+    def find_jack_files(self):
+        """ The input .jack file, or all .jack files in the input directory, in a stable order. """
+        if not os.path.isdir(self.input_path):
+            return [self.input_path]
+        return [os.path.join(self.input_path, file) for file in sorted(os.listdir(self.input_path))
+                if file.endswith('.jack')]
 
     def analyze(self):
         """
-        Process all .jack files in self.files_to_process, creating corresponding .xml files.
+        Process all .jack files in self.files_to_process, creating corresponding .vm files.
+        With jobs > 1 the files are compiled in a pool of worker processes.
+        A file that fails to compile does not stop the others.
+        :return: List of (jack_file, error message) for the files that failed,
+                 in self.files_to_process order
         """
-        for jack_file in self.files_to_process:
-            self.process_file(jack_file)
+        if self.profile:
+            self.profile_report = {'files': {}}
+            wall, cpu = time.perf_counter(), time.process_time()
+        # Declarations-only pre-pass over every class, shared by all the engines
+        self.program_index = ProgramIndex(self.files_to_process,
+                                          self.directory if self.use_cache else None)
+        if self.profile:
+            self.profile_report['index'] = {'wall': round(time.perf_counter() - wall, 6),
+                                            'cpu': round(time.process_time() - cpu, 6)}
+        self.cache = self.open_cache()
+        self.results = {}
+        return self.build(self.files_to_process)
+
+    def open_cache(self):
+        """ The BuildCache for the current options and program, or None if not used. """
+        # A whole-program build compiles every file again
+        if not self.use_cache or self.whole_program:
+            return None
+        key = (COMPILER_VERSION,) + self.optimizations
+        if 'inline' in self.optimizations:
+            # Inlined bodies come from other files, so any change to one
+            # of them has to rebuild every class
+            key += (self.program_index.inline_digest(),)
+        return BuildCache(self.directory, ' '.join(key))
+
+    def build(self, jack_files):
+        """
+        Compiles jack_files and writes the output, keeping the last results of
+        the other files in self.files_to_process (see watch()).
+        :return: List of (jack_file, error message) over all the files, as analyze(),
+                 and (self.asm_file or, with 'shake', self.input_path, error
+                 message) for each error in linking the program
+        """
+        if self.jobs > 1 and len(jack_files) > 1:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                self.results.update(zip(jack_files, pool.map(self.try_process_file, jack_files)))
+        else:
+            self.results.update((jack_file, self.try_process_file(jack_file)) for jack_file in jack_files)
+        results = [self.results[jack_file] for jack_file in self.files_to_process]
+        link_errors = []
+        if self.backend == 'asm':
+            results, link_errors = self.write_asm(results)
+        elif 'shake' in self.optimizations:
+            results, link_errors = self.shake(results)
+
+        errors = []
+        self.stats = {}
+        for jack_file, (entry, stats, error) in zip(self.files_to_process, results):
+            if error is not None:
+                errors.append((jack_file, error))
+            if stats:
+                self.stats[jack_file] = stats
+            if self.cache is not None:
+                if error is not None:
+                    self.cache.forget(jack_file)
+                elif entry is not None:
+                    self.cache.update(jack_file, entry)
+        if self.cache is not None:
+            self.cache.save()
+        program = self.asm_file if self.backend == 'asm' else self.input_path
+        errors.extend((program, error) for error in link_errors)
+        return errors
+
+    def try_process_file(self, jack_file):
+        """
+        Process a single .jack file, returning an error message instead of raising.
+        :return: (cache entry or None, stats or None, error message or None),
+                 or for a whole-program build, (VMFunctions, stats, error)
+                 from compile_functions()
+        """
+        process = self.compile_functions if self.whole_program else self.process_file
+        try:
+            return process(jack_file) + (None,)
+        except Exception as e:
+            return None, None, f"{type(e).__name__}: {e}"
 
     def process_file(self, jack_file):
         """
         Process a single .jack file by creating a CompilationEngine and calling compile_class().
+        The file is skipped if the build cache shows it and its .vm are unchanged.
+        :return: (cache entry, stats): the new cache entry for the file, or None
+                 if the cache is off or the file was skipped, and the engine's
+                 optimization stats
         """
         output_file = jack_file[:-5] + '.vm'
-        engine = CompilationEngine(jack_file, output_file)
-        engine.compile_class()
-        engine.close()
+        if self.cache is not None and self.cache.is_fresh(jack_file, output_file):
+            return None, None
+
+        engine = self.compile(jack_file, output_file, buffered=True)
+        if self.cache is not None:
+            return self.cache.entry(jack_file, output_file), engine.stats
+        return None, engine.stats
+
+    def compile_functions(self, jack_file):
+        """
+        Compile a single .jack file without writing its .vm file, for a
+        whole-program build.
+        :return: (the file's VMFunctions, the engine's optimization stats)
+        """
+        engine = self.compile(jack_file, None, ir=True)
+        return engine.vm_writer.functions, engine.stats
+
+    def compile(self, jack_file, output_file, **engine_options):
+        """
+        Runs a CompilationEngine over jack_file, profiled if self.profile is set.
+        :return: The engine, closed
+        """
+        engine_options.update(optimizations=self.optimizations, program_index=self.program_index)
+        if self.profile:
+            profile = FileProfile()
+            try:
+                return profile.compile(jack_file, output_file, self.tokenizer_mode, **engine_options)
+            finally:
+                self.profile_report['files'][jack_file] = profile.report()
+
+        engine = CompilationEngine(jack_file, output_file, self.tokenizer_mode, **engine_options)
+        try:
+            engine.compile_class()
+        finally:
+            engine.close()
+        return engine
+
+    def shake(self, results):
+        """
+        Writes each compiled file's .vm with only the functions reachable from
+        ENTRY_POINTS and self.roots, over the call graph of the whole program.
+        Nothing is written if a root is not defined or none of them is.
+        :param results: (VMFunctions, stats, error) per file, from try_process_file()
+        :return: ((None, stats, error) per file, as try_process_file() returns
+                 without 'shake', and the link error messages)
+        """
+        functions = self.compiled_functions(results)
+        link_errors = self.unknown_roots(functions)
+        if not any(name in functions for name in ENTRY_POINTS + self.roots):
+            link_errors.append(f"no {' or '.join(ENTRY_POINTS)} to start from")
+        if link_errors:
+            return [(None, stats, error) for _, stats, error in results], link_errors
+        reached = reachable_functions(functions, ENTRY_POINTS + self.roots)
+
+        shaken = []
+        for jack_file, (compiled, stats, error) in zip(self.files_to_process, results):
+            if error is not None:
+                shaken.append((None, None, error))
+                continue
+            kept = [function for function in compiled if function.name in reached]
+            stats['dropped'] = len(compiled) - len(kept)
+            with open(jack_file[:-5] + '.vm', 'w') as f:
+                f.write(serialize(kept))
+            shaken.append((None, stats, None))
+        return shaken, []
+
+    def unknown_roots(self, functions):
+        """ An error message for each of self.roots that is not in functions ({name: VMFunction}). """
+        return [f"no subroutine {root} to keep" for root in self.roots if root not in functions]
+
+    def compiled_functions(self, results):
+        """ {name: VMFunction} over the files in results that compiled. """
+        functions = {}
+        for compiled, _, error in results:
+            if error is None:
+                functions.update((function.name, function) for function in compiled)
+        return functions
+
+    def library_functions(self):
+        """
+        The VMFunctions of the .vm files in the directory that have no .jack
+        file, such as the OS classes, which the 'asm' backend links in.
+        A file is parsed again only when its stat changes.
+        """
+        sources = {os.path.basename(jack_file)[:-5] for jack_file in self.files_to_process}
+        functions = {}
+        libraries = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.vm') and name[:-3] not in sources:
+                vm_path = os.path.join(self.directory, name)
+                stat = file_stat(vm_path)
+                library = self.libraries.get(vm_path)
+                if library is None or library[0] != stat:
+                    with open(vm_path, 'r') as f:
+                        library = (stat, parse(f.read(), vm_path))
+                libraries[vm_path] = library
+                functions.update((function.name, function) for function in library[1])
+        self.libraries = libraries
+        return functions
+
+    def write_asm(self, results):
+        """
+        Links the compiled files and the library .vm files into self.asm_file:
+        a bootstrap that calls Sys.init if the program has one (the OS does),
+        else Main.main, and every function, or with 'shake' only those
+        reachable from there and from self.roots. Nothing is written if a
+        file failed to compile.
+        :param results: (VMFunctions, stats, error) per file, from try_process_file()
+        :return: ((None, stats, error) per file, as try_process_file() returns
+                 for the 'vm' backend, and the link error messages)
+        """
+        linked = [(None, stats, error) for _, stats, error in results]
+        if any(error is not None for _, _, error in results):
+            return linked, []
+        try:
+            functions = self.library_functions()
+        except (OSError, ValueError) as e:
+            return linked, [f"{type(e).__name__}: {e}"]
+        # A compiled class replaces a library one of the same name
+        functions.update(self.compiled_functions(results))
+        entry = 'Sys.init' if 'Sys.init' in functions else 'Main.main'
+        if entry not in functions:
+            return linked, ["no Sys.init or Main.main to start from"]
+
+        if 'shake' in self.optimizations:
+            link_errors = self.unknown_roots(functions)
+            if link_errors:
+                return linked, link_errors
+            reached = reachable_functions(functions, (entry,) + self.roots)
+            for compiled, stats, _ in results:
+                stats['dropped'] = sum(function.name not in reached for function in compiled)
+            functions = {name: function for name, function in functions.items() if name in reached}
+        undefined = sorted({instruction.arg1 for function in functions.values() for instruction in function.code
+                            if instruction.op == CALL and instruction.arg1 not in functions})
+        if undefined:
+            return linked, [f"undefined functions: {', '.join(undefined)}"]
+
+        writer = AsmWriter(self.asm_file, self.lowered)
+        writer.write_bootstrap(entry)
+        for function in functions.values():
+            writer.write_function(function)
+        writer.close()
+        return linked, []
+
+    def watch(self, interval=WATCH_INTERVAL, report=None):
+        """
+        Builds once, then polls the .jack files' mtime and size every interval
+        seconds and rebuilds only the files that changed, until interrupted.
+        The process, the program index, the build cache and every file's last
+        result stay in memory, so a rebuild costs about the changed files'
+        compile. When 'inline' is on and a change alters an inlinable
+        subroutine, every file is rebuilt, as analyze() would.
+        New and deleted files in the input directory are picked up too.
+        :param report: Called after each build with (jack files built,
+                       errors as analyze() returns them, seconds taken)
+        """
+        start = time.perf_counter()
+        errors = self.analyze()
+        if report is not None:
+            report(self.files_to_process, errors, time.perf_counter() - start)
+        stats = {jack_file: file_stat(jack_file) for jack_file in self.files_to_process}
+        while True:
+            time.sleep(interval)
+            jack_files = self.find_jack_files()
+            current = {jack_file: file_stat(jack_file) for jack_file in jack_files}
+            if current == stats:
+                continue
+            start = time.perf_counter()
+            changed = [jack_file for jack_file in jack_files if current[jack_file] != stats.get(jack_file)]
+            stats = current
+            built, errors = self.rebuild(jack_files, changed)
+            if report is not None:
+                report(built, errors, time.perf_counter() - start)
+
+    def rebuild(self, jack_files, changed):
+        """
+        Brings the last build up to date after a change on disk.
+        :param jack_files: The program's .jack files now
+        :param changed: Those of jack_files that are new or were modified
+        :return: (the files compiled, errors as build() returns them)
+        """
+        for jack_file in set(self.files_to_process) - set(jack_files):
+            self.results.pop(jack_file, None)
+            if self.cache is not None:
+                self.cache.forget(jack_file)
+        self.files_to_process = jack_files
+
+        inlining = 'inline' in self.optimizations
+        digest = self.program_index.inline_digest() if inlining else None
+        self.program_index.update(jack_files)
+        if inlining and self.program_index.inline_digest() != digest:
+            changed = jack_files
+            self.cache = self.open_cache()
+        return changed, self.build(changed)
+
+
+def print_stats(compiler, jack_files):
+    for jack_file in jack_files:
+        class_name = os.path.basename(jack_file)[:-5]
+        for stat, count in compiler.stats.get(jack_file, {}).items():
+            print(f"{class_name}: {count} {STAT_DESCRIPTIONS[stat]}")
+
+
+def print_errors(errors):
+    for jack_file, error in errors:
+        print(f"{jack_file}: {error}", file=sys.stderr)
+
+
+def job_count(text):
+    """ argparse type for --jobs: a whole number, 0 or more. """
+    if not text.isdigit():
+        raise argparse.ArgumentTypeError(f"expected 0 or a positive number of workers: {text!r}")
+    return int(text)
+
+
+def subroutine_name(text):
+    """ argparse type for --keep: a 'Class.name' subroutine name. """
+    parts = text.split('.')
+    if len(parts) != 2 or not all(part.isidentifier() for part in parts):
+        raise argparse.ArgumentTypeError(f"expected CLASS.NAME, e.g. Main.main: {text!r}")
+    return text
 
 
 def main():
     # Usage: python JackCompiler.py path/to/MyProgram.jack
     #    or: python JackCompiler.py path/to/DirectoryOfJackFiles
-    if len(sys.argv) != 2:
-        print("Usage: python JackCompiler.py <input_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Compile Jack source files to VM code or Hack assembly.")
+    parser.add_argument('input_path', help="a .jack file or a directory of .jack files")
+    parser.add_argument('--tokenizer', choices=sorted(TOKENIZER_MODES), default='eager',
+                        help="'stream' scans each file lazily instead of building its token list up front; "
+                             "'mmap' keeps token offsets into the memory-mapped file")
+    parser.add_argument('-j', '--jobs', type=job_count, default=1,
+                        help="compile files in N worker processes (0 = one per CPU, 1 = serial)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="recompile every file instead of skipping those unchanged since the last build")
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help=f"enable the default optimizations ({', '.join(DEFAULT_OPTIMIZATIONS)})")
+    parser.add_argument('--opt', action='append', choices=OPTIMIZATIONS, default=[],
+                        help="enable one optimization (repeatable)")
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='FILE',
+                        help="write per-file phase times, tokenizer call counts and opcode counts "
+                             "as JSON to FILE (default profile.json); compiles every file, serially")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="run the build (serially) under cProfile and dump its stats to FILE")
+    parser.add_argument('--backend', choices=BACKENDS, default='vm',
+                        help="'asm' writes the whole program, with the directory's other .vm files "
+                             "(e.g. the OS), as one Hack .asm file instead of a .vm file per class")
+    parser.add_argument('--keep', action='append', default=[], type=subroutine_name, metavar='CLASS.NAME',
+                        help=f"with --opt shake, also keep this subroutine and what it calls "
+                             f"(repeatable; {' and '.join(ENTRY_POINTS)} are always kept)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and rebuild the .jack files that change (polling their "
+                             "mtime and size) until interrupted")
+    parser.add_argument('--poll', type=float, default=WATCH_INTERVAL, metavar='SECONDS',
+                        help=f"with --watch, how often to look for changes (default {WATCH_INTERVAL})")
+    args = parser.parse_args()
+    if args.watch and (args.profile or args.cprofile):
+        parser.error("--watch cannot be combined with --profile or --cprofile")
 
-    input_path = sys.argv[1]
-    compiler = JackCompiler(input_path)
-    compiler.analyze()
+    jobs = args.jobs or os.cpu_count() or 1
+    if args.cprofile:
+        # cProfile only sees this process
+        jobs = 1
+    optimizations = list(args.opt)
+    if args.optimize:
+        optimizations.extend(DEFAULT_OPTIMIZATIONS)
+    compiler = JackCompiler(args.input_path, tokenizer_mode=args.tokenizer, jobs=jobs,
+                            use_cache=not args.no_cache, optimizations=optimizations,
+                            roots=args.keep, profile=args.profile is not None, backend=args.backend)
+    if args.watch:
+        def report(jack_files, errors, seconds):
+            print_stats(compiler, jack_files)
+            print_errors(errors)
+            print(f"built {len(jack_files)} file(s) in {seconds * 1000:.0f} ms"
+                  f"{f', {len(errors)} error(s)' if errors else ''}; watching for changes", flush=True)
+        try:
+            compiler.watch(args.poll, report)
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        errors = profiler.runcall(compiler.analyze)
+        profiler.dump_stats(args.cprofile)
+    else:
+        errors = compiler.analyze()
+    if args.profile:
+        with open(args.profile, 'w') as f:
+            json.dump(compiler.profile_report, f, indent=1)
+    print_stats(compiler, compiler.stats)
+    print_errors(errors)
+    if errors:
+        sys.exit(1)
     print('finished!')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
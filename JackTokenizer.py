@@ -1,111 +1,117 @@
+import mmap
 import re
+import sys
+from array import array
+
+KEYWORDS = frozenset({
+    'class', 'constructor', 'function', 'method', 'field', 'static',
+    'var', 'int', 'char', 'boolean', 'void', 'true', 'false', 'null',
+    'this', 'let', 'do', 'if', 'else', 'while', 'return'
+})
+SYMBOLS = frozenset('{}()[].,;+-*/&|<>=~')
+
+# One alternative per token shape, tried left to right at each position:
+#   // line comment or /* block comment */ (no group, so skipped),
+#   string constant (an unterminated one runs to end of input),
+#   single-character symbol,
+#   run of anything else up to whitespace, a quote or a symbol.
+# Whitespace between tokens is skipped by finditer.
+# The group number of the match (match.lastindex) tells the shapes apart;
+# it is None for comments.
+STRING_GROUP, SYMBOL_GROUP, WORD_GROUP = 1, 2, 3
+TOKEN_PATTERN = re.compile(r'''
+    //[^\n]* | /\*[\s\S]*?\*/
+  | ( "[^"]*"? )
+  | ( [{}()\[\].,;+\-*/&|<>=~] )
+  | ( [^\s"{}()\[\].,;+\-*/&|<>=~]+ )
+''', re.VERBOSE)
+# The same pattern over bytes, for scanning a memory-mapped file
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode('ascii'), re.VERBOSE)
+
 
 class JackTokenizer:
     def __init__(self, input_file):
         self.input_file = input_file
 
-        # 1) Build the token list
-        self.listOfTokens = self.cleanAndTokenize(input_file)
+        # 1) Build the token list, classifying every token once while scanning.
+        #    listOfTokens, tokenTypes and tokenValues are parallel lists:
+        #    tokenValues holds the int of an INT_CONST and the unquoted text
+        #    of a STRING_CONST, and the token itself otherwise.
+        self.listOfTokens = []
+        self.tokenTypes = []
+        self.tokenValues = []
+        for token, token_type, value in self.cleanAndTokenize(input_file):
+            self.listOfTokens.append(token)
+            self.tokenTypes.append(token_type)
+            self.tokenValues.append(value)
         self.tokenLength = len(self.listOfTokens)
 
         # 2) Set up currentToken, currentTokenIndex
         if self.tokenLength == 0:
             self.currentToken = None
+            self.currentType = None
+            self.currentValue = None
             self.currentTokenIndex = -1
         else:
             self.currentTokenIndex = 0
             self.currentToken = self.listOfTokens[0]
+            self.currentType = self.tokenTypes[0]
+            self.currentValue = self.tokenValues[0]
 
     def cleanAndTokenize(self, input_file):
         """
-        Reads the file, removes comments, then returns a list of Jack tokens by
-        scanning character-by-character.
+        Reads the file and returns an iterator of (token, token_type, value)
+        triples. Comments are skipped by the scan itself.
         """
-        text = self.remove_comments(input_file)
-        return self.tokenize(text)
+        return self.scan(self.read_source(input_file))
 
-    def remove_comments(self, input_file):
+    def read_source(self, input_file):
         """
-        Removes all // and /* */ comments, returning the cleaned text as a single string.
+        Returns the whole source file as a single string.
         """
         with open(input_file, 'r') as f:
-            text = f.read()
-
-        # 1) Remove all block comments (/* ... */) with a regex (non-greedy)
-        text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
-
-        # 2) Remove everything after // in each line
-        cleaned_lines = []
-        for line in text.split('\n'):
-            line = line.split('//')[0]
-            cleaned_lines.append(line)
-        text = '\n'.join(cleaned_lines)
-
-        return text
+            return f.read()
 
     def tokenize(self, text):
         """
-        Goes through the cleaned text character-by-character, splitting into tokens:
+        Splits the text into a list of token strings, dropping comments.
+        """
+        return [match.group() for match in TOKEN_PATTERN.finditer(text)
+                if match.lastindex is not None]
+
+    def scan(self, text):
+        """
+        Goes through the text in a single pass with TOKEN_PATTERN, skipping
+        comments, and yields (token, token_type, value) for each token:
         - Symbols
         - String constants in quotes
         - Integers, keywords, and identifiers
         """
-        symbols = set('{}()[].,;+-*/&|<>=~')
-        tokens = []
-
-        current_token = ''
-        inside_string = False
-
-        i = 0
-        while i < len(text):
-            char = text[i]
-
-            if inside_string:
-                # We are inside a string constant
-                current_token += char
-                if char == '"':
-                    # End of string constant
-                    tokens.append(current_token)
-                    current_token = ''
-                    inside_string = False
-                i += 1
-            else:
-                # Not inside a string
-                if char.isspace():
-                    # Whitespace -> end the current token (if any)
-                    if current_token:
-                        tokens.append(current_token)
-                        current_token = ''
-                    i += 1
-
-                elif char == '"':
-                    # Start of a string constant
-                    # If there's a token building, first finalize it
-                    if current_token:
-                        tokens.append(current_token)
-                        current_token = ''
-                    current_token = '"'
-                    inside_string = True
-                    i += 1
-
-                elif char in symbols:
-                    # Symbol is a separate token
-                    if current_token:
-                        tokens.append(current_token)
-                        current_token = ''
-                    tokens.append(char)  # the symbol itself
-                    i += 1
-
+        for match in TOKEN_PATTERN.finditer(text):
+            token = match.group()
+            group = match.lastindex
+            if group == SYMBOL_GROUP:
+                yield token, 'SYMBOL', token
+            elif group == WORD_GROUP:
+                if token in KEYWORDS:
+                    yield token, 'KEYWORD', token
+                elif token.isdigit():
+                    yield token, 'INT_CONST', int(token)
                 else:
-                    # Building up an identifier, keyword, or integer
-                    current_token += char
-                    i += 1
-
-        # If there's any leftover token after the loop
-        if current_token:
-            tokens.append(current_token)
+                    yield token, 'IDENTIFIER', token
+            elif group is None:
+                # A comment
+                continue
+            elif token.endswith('"'):
+                yield token, 'STRING_CONST', token.strip('"')
+            else:
+                # An unterminated string constant
+                yield token, 'IDENTIFIER', token
 
-        return tokens
+    def close(self):
+        """
+        Releases the source. Nothing to do here: the file was read into memory.
+        """
 
     def hasMoreTokens(self):
         """
@@ -120,32 +126,14 @@ class JackTokenizer:
         if self.hasMoreTokens():
             self.currentTokenIndex += 1
             self.currentToken = self.listOfTokens[self.currentTokenIndex]
+            self.currentType = self.tokenTypes[self.currentTokenIndex]
+            self.currentValue = self.tokenValues[self.currentTokenIndex]
 
     def token_type(self):
         """
         Returns: 'KEYWORD', 'SYMBOL', 'IDENTIFIER', 'INT_CONST', or 'STRING_CONST'
         """
-        if self.currentToken is None:
-            return None
-
-        keywords = {
-            'class', 'constructor', 'function', 'method', 'field', 'static',
-            'var', 'int', 'char', 'boolean', 'void', 'true', 'false', 'null',
-            'this', 'let', 'do', 'if', 'else', 'while', 'return'
-        }
-        symbols = set('{}()[].,;+-*/&|<>=~')
-
-        token = self.currentToken
-        if token in keywords:
-            return 'KEYWORD'
-        elif token in symbols:
-            return 'SYMBOL'
-        elif token.startswith('"') and token.endswith('"'):
-            return 'STRING_CONST'
-        elif token.isdigit():
-            return 'INT_CONST'
-        else:
-            return 'IDENTIFIER'
+        return self.currentType
 
     def keyWord(self):
         return self.currentToken  # valid only if token_type == 'KEYWORD'
@@ -157,8 +145,159 @@ class JackTokenizer:
         return self.currentToken  # valid only if token_type == 'IDENTIFIER'
 
     def intVal(self):
-        return int(self.currentToken)  # valid only if token_type == 'INT_CONST'
+        return self.currentValue  # valid only if token_type == 'INT_CONST'
 
     def stringVal(self):
-        # Strip off the leading & trailing quotes
-        return self.currentToken.strip('"')
\ No newline at end of file
+        return self.currentValue  # valid only if token_type == 'STRING_CONST'
+
+
+class StreamingJackTokenizer(JackTokenizer):
+    """
+    A JackTokenizer that scans lazily instead of building the token lists up
+    front. Only the current token and one token of lookahead (for
+    hasMoreTokens) are held, so tokenizing overlaps with compilation.
+    """
+    def __init__(self, input_file):
+        self.input_file = input_file
+
+        # 1) Start the scan; listOfTokens/tokenLength are never built
+        self._stream = self.cleanAndTokenize(input_file)
+        self._lookahead = next(self._stream, None)
+
+        # 2) Set up currentToken, currentTokenIndex
+        self.currentTokenIndex = -1
+        self.currentToken = None
+        self.currentType = None
+        self.currentValue = None
+        self.advance()
+
+    def hasMoreTokens(self):
+        """
+        Returns True if there is a next token, False otherwise.
+        """
+        return self._lookahead is not None
+
+    def advance(self):
+        """
+        Moves to the next token, if it exists.
+        """
+        if self._lookahead is not None:
+            self.currentTokenIndex += 1
+            self.currentToken, self.currentType, self.currentValue = self._lookahead
+            self._lookahead = next(self._stream, None)
+
+
+# Kind codes stored by MappedJackTokenizer, indexing TOKEN_TYPES
+KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST = range(5)
+TOKEN_TYPES = ('KEYWORD', 'SYMBOL', 'IDENTIFIER', 'INT_CONST', 'STRING_CONST')
+KEYWORD_BYTES = frozenset(keyword.encode('ascii') for keyword in KEYWORDS)
+# Keywords and symbols decode to these shared strings
+FIXED_TEXT = {token.encode('ascii'): token for token in KEYWORDS | SYMBOLS}
+
+
+class MappedJackTokenizer(JackTokenizer):
+    """
+    A JackTokenizer over a memory-mapped source file. Each token is kept as
+    (start, end, kind) offsets into the mapping in three compact arrays;
+    its text is only decoded (and identifiers interned) when advance()
+    makes it the current token.
+    """
+    def __init__(self, input_file):
+        self.input_file = input_file
+
+        # 1) Map the file and record the offsets of every token
+        self.starts = array('q')
+        self.ends = array('q')
+        self.kinds = array('b')
+        self.source = self.map_source(input_file)
+        if self.source is not None:
+            self.scan_offsets(self.source)
+        self.tokenLength = len(self.kinds)
+
+        # 2) Set up currentToken, currentTokenIndex
+        self.currentTokenIndex = -1
+        self.currentToken = None
+        self.currentType = None
+        self.currentValue = None
+        self.advance()
+
+    def map_source(self, input_file):
+        """
+        Returns a read-only mapping of the file, or None if it is empty
+        (an empty file cannot be mapped).
+        """
+        with open(input_file, 'rb') as f:
+            if f.seek(0, 2) == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def scan_offsets(self, source):
+        """
+        Scans the mapped bytes once, appending each token's offsets and kind.
+        """
+        starts, ends, kinds = self.starts, self.ends, self.kinds
+        for match in BYTES_TOKEN_PATTERN.finditer(source):
+            group = match.lastindex
+            if group is None:
+                # A comment
+                continue
+            if group == SYMBOL_GROUP:
+                kind = SYMBOL
+            elif group == WORD_GROUP:
+                token = match.group()
+                if token in KEYWORD_BYTES:
+                    kind = KEYWORD
+                elif token.isdigit():
+                    kind = INT_CONST
+                else:
+                    kind = IDENTIFIER
+            elif source[match.end() - 1] == ord('"'):
+                kind = STRING_CONST
+            else:
+                # An unterminated string constant
+                kind = IDENTIFIER
+            start, end = match.span()
+            starts.append(start)
+            ends.append(end)
+            kinds.append(kind)
+
+    def close(self):
+        """
+        Releases the mapping.
+        """
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def advance(self):
+        """
+        Moves to the next token, if it exists, decoding its text.
+        """
+        if self.hasMoreTokens():
+            self.currentTokenIndex += 1
+            i = self.currentTokenIndex
+            raw = self.source[self.starts[i]:self.ends[i]]
+            kind = self.kinds[i]
+            if kind == KEYWORD or kind == SYMBOL:
+                token = FIXED_TEXT[raw]
+                value = token
+            elif kind == IDENTIFIER:
+                token = sys.intern(raw.decode())
+                value = token
+            elif kind == INT_CONST:
+                token = raw.decode()
+                value = int(raw)
+            else:
+                token = raw.decode()
+                value = token.strip('"')
+            self.currentToken = token
+            self.currentType = TOKEN_TYPES[kind]
+            self.currentValue = value
+
+
+# Tokenizer class for each --tokenizer mode
+TOKENIZER_MODES = {
+    'eager': JackTokenizer,
+    'stream': StreamingJackTokenizer,
+    'mmap': MappedJackTokenizer,
+}
@@ -0,0 +1,112 @@
+import functools
+import time
+from collections import Counter
+from contextlib import contextmanager
+from CompilationEngine import CompilationEngine
+from JackTokenizer import TOKENIZER_MODES
+
+# Tokenizer methods whose calls are counted while profiling
+COUNTED_TOKENIZER_METHODS = ('advance', 'token_type')
+
+
+@contextmanager
+def counting_calls(cls, method_names, counts):
+    """
+    Replaces the named methods on cls with wrappers that count their calls
+    into counts, and puts the originals back on exit. Only code run inside
+    the block pays for the counting.
+    """
+    originals = {name: cls.__dict__.get(name) for name in method_names}
+
+    def counted(name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in method_names:
+        setattr(cls, name, counted(name, getattr(cls, name)))
+    try:
+        yield counts
+    finally:
+        for name, original in originals.items():
+            if original is None:
+                # inherited: drop the wrapper to expose the base class's method again
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+
+
+class FileProfile:
+    """
+    Wall and CPU time per compilation phase of one .jack file, with the
+    number of tokens, tokenizer calls and emitted VM instructions by opcode.
+    Phases:
+      tokenize: creating the engine and its tokenizer (the whole scan for
+                'eager'; 'stream' and 'mmap' scan during parse instead)
+      parse:    compile_class() apart from the optimizations
+      optimize: the IR passes run at the end of compile_class()
+      write:    close(), which writes the .vm file
+    """
+
+    def __init__(self):
+        # phase -> {'wall': seconds, 'cpu': seconds}
+        self.phases = {}
+        self.calls = Counter()
+        self.tokens = 0
+        self.opcodes = Counter()
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            times = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            times['wall'] += time.perf_counter() - wall
+            times['cpu'] += time.process_time() - cpu
+
+    def compile(self, jack_file, output_file, tokenizer_mode, **engine_options):
+        """
+        Compiles jack_file to output_file (None keeps the code in memory)
+        like JackCompiler does, measuring it.
+        :return: The CompilationEngine, closed
+        """
+        tokenizer_class = TOKENIZER_MODES[tokenizer_mode]
+        with counting_calls(tokenizer_class, COUNTED_TOKENIZER_METHODS, self.calls):
+            with self.phase('tokenize'):
+                engine = CompilationEngine(jack_file, output_file, tokenizer_mode, **engine_options)
+            try:
+                optimize = engine.optimize
+
+                def timed_optimize():
+                    with self.phase('optimize'):
+                        optimize()
+                engine.optimize = timed_optimize
+                with self.phase('parse'):
+                    engine.compile_class()
+                # compile_class() includes optimize(), counted on its own
+                for kind, seconds in self.phases.get('optimize', {}).items():
+                    self.phases['parse'][kind] -= seconds
+            finally:
+                with self.phase('write'):
+                    engine.close()
+
+        self.tokens = engine.tokenizer.currentTokenIndex + 1
+        if output_file is None:
+            text = engine.vm_writer.getvalue()
+        else:
+            with open(output_file, 'r') as f:
+                text = f.read()
+        self.opcodes.update(line.split(' ', 1)[0] for line in text.splitlines())
+        return engine
+
+    def report(self):
+        return {
+            'phases': {name: {kind: round(seconds, 6) for kind, seconds in times.items()}
+                       for name, times in self.phases.items()},
+            'tokens': self.tokens,
+            'calls': dict(self.calls),
+            'opcodes': dict(sorted(self.opcodes.items())),
+        }
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from BuildCache import file_hash, file_stat
+from JackTokenizer import StreamingJackTokenizer
+from SymbolTable import SymbolTable
+
+# kind: 'constructor', 'function' or 'method'; arity: declared parameters
+# (not counting a method's 'this'); return_type: 'void', 'int', a class name, ...
+# inline: the body, if it is simple enough to inline at call sites (see
+# trivial_body), else None
+Signature = namedtuple('Signature', ['kind', 'arity', 'return_type', 'inline'], defaults=[None])
+
+KEYWORD_CONSTANTS = {'true': -1, 'false': 0, 'null': 0}
+
+
+def trivial_body(symbol_table, kind, body):
+    """
+    Recognizes the subroutine bodies that can be inlined at a call site:
+      return;  return c;  return field;  return argument;  return this;
+      let field = (argument | field | c); return;
+    :param symbol_table: The class's fields and the subroutine's arguments
+    :param kind: 'constructor', 'function' or 'method'
+    :param body: The (token, token type) pairs between the body's braces
+    :return: ('return', operand) or ('store', field index, operand), where an
+             operand is ('constant', value), ('argument', index) or
+             ('field', index); None if the body is not trivial
+    """
+    if kind == 'constructor':
+        return None
+    tokens = [token for token, _ in body]
+    if tokens == ['return', ';']:
+        return 'return', ('constant', 0)
+    if len(tokens) == 3 and tokens[0] == 'return' and tokens[2] == ';':
+        operand = _operand(symbol_table, kind, body[1])
+        if operand is not None:
+            return 'return', operand
+    if (len(tokens) == 7 and tokens[0] == 'let' and tokens[2] == '=' and tokens[4] == ';'
+            and tokens[5:] == ['return', ';']):
+        target = _operand(symbol_table, kind, body[1])
+        operand = _operand(symbol_table, kind, body[3])
+        if target is not None and target[0] == 'field' and operand is not None:
+            return 'store', target[1], operand
+    return None
+
+
+def _operand(symbol_table, kind, term):
+    """ The operand a single-token term reads, or None if it is not one we inline. """
+    token, token_type = term
+    if token_type == 'INT_CONST':
+        return 'constant', int(token)
+    if token in KEYWORD_CONSTANTS and token_type == 'KEYWORD':
+        return 'constant', KEYWORD_CONSTANTS[token]
+    if token == 'this' and token_type == 'KEYWORD':
+        return ('argument', 0) if kind == 'method' else None
+    if token_type != 'IDENTIFIER':
+        return None
+    var_kind = symbol_table.kindOf(token)
+    if var_kind == 'arg':
+        return 'argument', symbol_table.indexOf(token)
+    if var_kind == 'field' and kind == 'method':
+        return 'field', symbol_table.indexOf(token)
+    # statics live in the callee's own file, locals need a frame
+    return None
+
+
+def scan_declarations(jack_file):
+    """
+    Reads only the declarations of a .jack file: the class name, the field
+    layout, and each subroutine's Signature. Subroutine bodies are skipped by
+    brace depth rather than parsed; only those of a few tokens are kept, to
+    see if they are trivial.
+    :return: (class name, {subroutine name: Signature})
+    """
+    tokenizer = StreamingJackTokenizer(jack_file)
+    symbol_table = SymbolTable()
+    try:
+        # 'class' className '{'
+        tokenizer.advance()
+        class_name = tokenizer.currentToken
+        subroutines = {}
+
+        while tokenizer.hasMoreTokens():
+            tokenizer.advance()
+            token = tokenizer.currentToken
+            if tokenizer.token_type() != 'KEYWORD':
+                continue
+            if token in ('static', 'field'):
+                # ('static' | 'field') type varName (',' varName)* ';'
+                tokenizer.advance()
+                var_type = tokenizer.currentToken
+                tokenizer.advance()
+                while tokenizer.currentToken != ';' and tokenizer.hasMoreTokens():
+                    if tokenizer.currentToken != ',':
+                        symbol_table.define(tokenizer.currentToken, var_type, token)
+                    tokenizer.advance()
+            elif token in ('constructor', 'function', 'method'):
+                symbol_table.startSubroutine()
+                if token == 'method':
+                    symbol_table.define('this', class_name, 'arg')
+                tokenizer.advance()
+                return_type = tokenizer.currentToken
+                tokenizer.advance()
+                name = tokenizer.currentToken
+                tokenizer.advance()  # '('
+                tokenizer.advance()
+                arity = 0
+                while tokenizer.currentToken != ')' and tokenizer.hasMoreTokens():
+                    # type varName, separated by ','
+                    if tokenizer.currentToken != ',':
+                        arity += 1
+                        var_type = tokenizer.currentToken
+                        tokenizer.advance()
+                        symbol_table.define(tokenizer.currentToken, var_type, 'arg')
+                    tokenizer.advance()
+                tokenizer.advance()  # '{'
+                body = _skip_body(tokenizer)
+                inline = trivial_body(symbol_table, token, body) if body is not None else None
+                subroutines[name] = Signature(token, arity, return_type, inline)
+        return class_name, subroutines
+    finally:
+        tokenizer.close()
+
+
+# Longest body trivial_body can match
+MAX_TRIVIAL_BODY = 7
+
+
+def _skip_body(tokenizer):
+    """
+    Advances past the '}' closing the body whose '{' is the current token.
+    :return: The body's (token, token type) pairs, or None if it is longer
+             than any trivial body
+    """
+    body = []
+    depth = 1
+    while tokenizer.hasMoreTokens():
+        tokenizer.advance()
+        token = tokenizer.currentToken
+        if tokenizer.token_type() == 'SYMBOL':
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+        if body is not None:
+            body.append((token, tokenizer.token_type()))
+            if len(body) > MAX_TRIVIAL_BODY:
+                body = None
+    return body
+
+
+def _as_tuple(value):
+    """ Undoes JSON's turning nested tuples into lists. """
+    if isinstance(value, list):
+        return tuple(_as_tuple(item) for item in value)
+    return value
+
+
+class ProgramIndex:
+    """
+    Every class's subroutine Signatures, built by a declarations-only
+    pre-pass over all the .jack files of a program, so each
+    CompilationEngine can see the classes it does not compile.
+    The index can be kept on disk (.jackindex) so that only files changed
+    since the last build are scanned again.
+    """
+    INDEX_NAME = '.jackindex'
+    # Bump when scan_declarations or Signature change
+    INDEX_VERSION = 2
+
+    def __init__(self, jack_files, cache_directory=None):
+        """
+        :param jack_files: The .jack files of the program
+        :param cache_directory: Directory to keep .jackindex in, or None to
+                                always scan every file
+        """
+        # class name -> {subroutine name: Signature}
+        self.classes = {}
+        # .jack file name -> its entry, as kept in .jackindex
+        self.files = {}
+        self.path = None
+        if cache_directory is not None:
+            self.path = os.path.join(cache_directory, self.INDEX_NAME)
+            self.files = self._load(self.path)
+        self.update(jack_files)
+
+    def update(self, jack_files):
+        """
+        Brings the index up to date with jack_files, the program's current
+        files: only files whose stat and contents changed since they were
+        last indexed are scanned again, and files not listed are dropped.
+        A long-running build (see JackCompiler.watch) keeps one index and
+        updates it instead of building a new one.
+        """
+        indexed = self.files
+        files = {}
+        classes = {}
+        for jack_file in jack_files:
+            name = os.path.basename(jack_file)
+            stat = file_stat(jack_file)
+            entry = indexed.get(name)
+            if entry is not None and entry['stat'] != stat and entry['hash'] != file_hash(jack_file):
+                entry = None
+            if entry is None:
+                try:
+                    class_name, subroutines = scan_declarations(jack_file)
+                except (OSError, ValueError):
+                    # Left out of the index; compiling the file reports the error
+                    continue
+                entry = {'hash': file_hash(jack_file), 'class': class_name, 'subroutines': subroutines}
+            entry = dict(entry, stat=stat)
+            files[name] = entry
+            classes[entry['class']] = {
+                subroutine: Signature(*_as_tuple(signature)) for subroutine, signature in entry['subroutines'].items()
+            }
+        self.classes = classes
+        self.files = files
+
+        if self.path is not None and files != indexed:
+            self._save(self.path, files)
+
+    def lookup(self, class_name, subroutine_name):
+        """ Returns the Signature of class_name.subroutine_name, or None if unknown. """
+        subroutines = self.classes.get(class_name)
+        if subroutines is None:
+            return None
+        return subroutines.get(subroutine_name)
+
+    def inline_digest(self):
+        """
+        A digest of every inlinable subroutine across the program. A class
+        compiled with inlining depends on these as well as on its own source,
+        so the digest goes into the build cache key.
+        """
+        inlinable = {}
+        for class_name, subroutines in self.classes.items():
+            bodies = {name: [signature.kind, signature.arity, signature.inline]
+                      for name, signature in subroutines.items() if signature.inline is not None}
+            # A class with nothing to inline does not affect other classes
+            if bodies:
+                inlinable[class_name] = bodies
+        return hashlib.sha256(json.dumps(inlinable, sort_keys=True).encode()).hexdigest()
+
+    def _load(self, path):
+        try:
+            with open(path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index, dict) or index.get('version') != self.INDEX_VERSION:
+            return {}
+        return index.get('files', {})
+
+    def _save(self, path, files):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            # json.dumps (unlike json.dump, or an indent) uses the C encoder
+            f.write(json.dumps({'version': self.INDEX_VERSION, 'files': files}, sort_keys=True))
+        os.replace(tmp_path, path)
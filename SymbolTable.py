@@ -1,9 +1,33 @@
+# VM segment each kind of identifier is stored in
+KIND_SEGMENTS = {"static": "static", "field": "this", "arg": "argument", "var": "local"}
+
+
+class Symbol:
+    """
+    A symbol table entry: an identifier's type, kind ('static', 'field',
+    'arg' or 'var'), index within its kind, and the VM segment it lives in.
+    """
+    __slots__ = ("type", "kind", "index", "segment")
+
+    def __init__(self, type_: str, kind: str, index: int):
+        self.type = type_
+        self.kind = kind
+        self.index = index
+        self.segment = KIND_SEGMENTS[kind]
+
+    def __repr__(self):
+        return f"Symbol({self.type!r}, {self.kind!r}, {self.index})"
+
+
 class SymbolTable:
     def __init__(self):
         # For class-scope identifiers (static, field)
         self.class_scope = {}
         # For subroutine-scope identifiers (arg, var)
         self.subroutine_scope = {}
+        # Every identifier visible in the current subroutine: the class scope
+        # overlaid with the subroutine scope, so a lookup is one dict access
+        self.visible = {}
         # Keep counters for each kind
         self.indexes = {"static": 0, "field": 0, "arg": 0, "var": 0}
 
@@ -12,7 +36,8 @@ class SymbolTable:
         Reset subroutine scope and the 'arg'/'var' indices.
         Call this at the start of compiling each subroutine.
         """
-        self.subroutine_scope.clear()
+        self.subroutine_scope = {}
+        self.visible = dict(self.class_scope)
         self.indexes["arg"] = 0
         self.indexes["var"] = 0
 
@@ -22,12 +47,15 @@ class SymbolTable:
         'kind' is one of ['static', 'field', 'arg', 'var'].
         """
         idx = self.indexes[kind]
-        entry = {"type": type_, "kind": kind, "index": idx}
+        entry = Symbol(type_, kind, idx)
 
         if kind in ("static", "field"):
             self.class_scope[name] = entry
+            # a subroutine's own names still shadow it
+            self.visible.setdefault(name, entry)
         else:
             self.subroutine_scope[name] = entry
+            self.visible[name] = entry
 
         self.indexes[kind] += 1
 
@@ -35,28 +63,25 @@ class SymbolTable:
         """Return # of variables of given kind."""
         return self.indexes[kind]
 
+    def resolve(self, name: str):
+        """
+        Return the Symbol for the named identifier in the current scope, or None.
+        """
+        return self.visible.get(name)
+
     def kindOf(self, name: str):
         """
         Return the kind of the named identifier: 'static', 'field', 'arg', 'var', or None.
         """
-        if name in self.subroutine_scope:
-            return self.subroutine_scope[name]["kind"]
-        elif name in self.class_scope:
-            return self.class_scope[name]["kind"]
-        return None
+        symbol = self.visible.get(name)
+        return symbol.kind if symbol is not None else None
 
     def typeOf(self, name: str):
         """Return the type of the named identifier."""
-        if name in self.subroutine_scope:
-            return self.subroutine_scope[name]["type"]
-        elif name in self.class_scope:
-            return self.class_scope[name]["type"]
-        return None
+        symbol = self.visible.get(name)
+        return symbol.type if symbol is not None else None
 
     def indexOf(self, name: str):
         """Return the index of the named identifier."""
-        if name in self.subroutine_scope:
-            return self.subroutine_scope[name]["index"]
-        elif name in self.class_scope:
-            return self.class_scope[name]["index"]
-        return None
+        symbol = self.visible.get(name)
+        return symbol.index if symbol is not None else None
@@ -0,0 +1,134 @@
+import sys
+
+# Opcodes of an Instruction
+PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, RETURN = range(8)
+
+# Segment codes (arg1 of PUSH/POP) index SEGMENTS
+SEGMENTS = ('constant', 'argument', 'local', 'static', 'this', 'that', 'pointer', 'temp')
+SEGMENT_CODES = {name: code for code, name in enumerate(SEGMENTS)}
+CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, POINTER, TEMP = range(len(SEGMENTS))
+
+# Arithmetic codes (arg1 of ARITHMETIC) index ARITHMETIC_COMMANDS
+ARITHMETIC_COMMANDS = ('add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not')
+ARITHMETIC_CODES = {name: code for code, name in enumerate(ARITHMETIC_COMMANDS)}
+ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT = range(len(ARITHMETIC_COMMANDS))
+
+
+def to_word(value):
+    """ Wraps an int to the VM's signed 16-bit range, as Hack arithmetic does. """
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+class Instruction:
+    """
+    One VM instruction:
+      PUSH/POP:   arg1 = segment code, arg2 = index
+      ARITHMETIC: arg1 = arithmetic code
+      LABEL/GOTO/IF_GOTO: arg1 = label (interned)
+      CALL:       arg1 = function name (interned), arg2 = number of arguments
+      RETURN:     no operands
+    """
+    __slots__ = ('op', 'arg1', 'arg2')
+
+    def __init__(self, op, arg1=None, arg2=None):
+        self.op = op
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __eq__(self, other):
+        return (isinstance(other, Instruction) and self.op == other.op
+                and self.arg1 == other.arg1 and self.arg2 == other.arg2)
+
+    def __repr__(self):
+        return f"Instruction({self.text()!r})"
+
+    def text(self):
+        """ Returns the instruction as a line of .vm text (no newline). """
+        op = self.op
+        if op == PUSH:
+            return f"push {SEGMENTS[self.arg1]} {self.arg2}"
+        elif op == POP:
+            return f"pop {SEGMENTS[self.arg1]} {self.arg2}"
+        elif op == ARITHMETIC:
+            return ARITHMETIC_COMMANDS[self.arg1]
+        elif op == LABEL:
+            return f"label {self.arg1}"
+        elif op == GOTO:
+            return f"goto {self.arg1}"
+        elif op == IF_GOTO:
+            return f"if-goto {self.arg1}"
+        elif op == CALL:
+            return f"call {self.arg1} {self.arg2}"
+        return "return"
+
+
+class VMFunction:
+    """
+    A function's header (name, number of locals) and its instructions.
+    """
+    __slots__ = ('name', 'n_locals', 'code')
+
+    def __init__(self, name, n_locals, code=None):
+        self.name = sys.intern(name)
+        self.n_locals = n_locals
+        self.code = code if code is not None else []
+
+    def __repr__(self):
+        return f"VMFunction({self.name!r}, {self.n_locals}, <{len(self.code)} instructions>)"
+
+
+def serialize(functions):
+    """
+    Returns the .vm text for a list of VMFunctions.
+    """
+    lines = []
+    for function in functions:
+        lines.append(f"function {function.name} {function.n_locals}")
+        lines.extend(instruction.text() for instruction in function.code)
+    lines.append('')
+    return '\n'.join(lines)
+
+
+# Commands of .vm text that take operands, by opcode
+_BRANCH_OPS = {'label': LABEL, 'goto': GOTO, 'if-goto': IF_GOTO}
+
+
+def parse(text, source='<vm>'):
+    """
+    Reads .vm text back into VMFunctions, the inverse of serialize().
+    Comments ('//' to end of line) and blank lines are ignored.
+    :param source: Name for error messages, e.g. the file path
+    :return: List of VMFunctions, in the order they appear
+    """
+    functions = []
+    function = None
+    for line_number, line in enumerate(text.splitlines(), 1):
+        words = line.split('//', 1)[0].split()
+        if not words:
+            continue
+        command = words[0]
+        try:
+            if command == 'function':
+                function = VMFunction(words[1], int(words[2]))
+                functions.append(function)
+                continue
+            if function is None:
+                raise ValueError("instruction outside a function")
+            if command == 'push' or command == 'pop':
+                segment = SEGMENT_CODES[words[1]]
+                instruction = Instruction(PUSH if command == 'push' else POP, segment, int(words[2]))
+            elif command in ARITHMETIC_CODES:
+                instruction = Instruction(ARITHMETIC, ARITHMETIC_CODES[command])
+            elif command in _BRANCH_OPS:
+                instruction = Instruction(_BRANCH_OPS[command], sys.intern(words[1]))
+            elif command == 'call':
+                instruction = Instruction(CALL, sys.intern(words[1]), int(words[2]))
+            elif command == 'return':
+                instruction = Instruction(RETURN)
+            else:
+                raise ValueError(f"unknown command '{command}'")
+        except (IndexError, KeyError, ValueError) as e:
+            raise ValueError(f"{source}:{line_number}: bad VM command '{line.strip()}' ({e})") from None
+        function.code.append(instruction)
+    return functions
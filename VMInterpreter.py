@@ -0,0 +1,580 @@
+import math
+import os
+import sys
+from VMCode import (PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL,
+                    CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, POINTER, TEMP,
+                    ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, parse, to_word)
+
+# Hack RAM layout
+RAM_SIZE = 32768
+SP, LCL, ARG, THIS_POINTER, THAT_POINTER = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+
+# Decoded operations. PUSH_ADDRESS/POP_ADDRESS cover the segments at a fixed
+# address (temp, pointer, static), resolved when decoding.
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_ADDRESS,
+ POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_ADDRESS,
+ OP_ADD, OP_SUB, OP_NEG, OP_EQ, OP_GT, OP_LT, OP_AND, OP_OR, OP_NOT,
+ OP_GOTO, OP_IF_GOTO, OP_CALL, OP_RETURN) = range(24)
+
+_ARITHMETIC_OPS = {ADD: OP_ADD, SUB: OP_SUB, NEG: OP_NEG, EQ: OP_EQ, GT: OP_GT,
+                   LT: OP_LT, AND: OP_AND, OR: OP_OR, NOT: OP_NOT}
+_PUSH_OPS = {LOCAL: PUSH_LOCAL, ARGUMENT: PUSH_ARGUMENT, THIS: PUSH_THIS, THAT: PUSH_THAT}
+_POP_OPS = {LOCAL: POP_LOCAL, ARGUMENT: POP_ARGUMENT, THIS: POP_THIS, THAT: POP_THAT}
+
+# Character codes the Jack OS gives special meaning
+NEW_LINE, BACKSPACE, DOUBLE_QUOTE = 128, 129, 34
+
+
+class VMError(Exception):
+    """ A runtime error of the VM program (a Sys.error, bad call, overflow...). """
+
+
+class _Halt(Exception):
+    """ Raised by Sys.halt to stop the program. """
+
+
+class JackOS:
+    """
+    Python stand-ins for the Jack OS classes, working on the interpreter's
+    RAM so programs can mix them with their own memory access. A String is
+    laid out as [max length, length, chars...].
+    Keyboard input is not available, and Screen calls draw nothing.
+    """
+
+    def __init__(self, ram):
+        self.ram = ram
+        self.output = []
+        # Bump allocator over the heap, reusing freed blocks of the same size
+        self.heap_top = HEAP_BASE
+        self.free_blocks = {}
+        self.block_sizes = {}
+
+    def functions(self):
+        """ {'Class.name': Python function} for every stand-in. """
+        table = {
+            'Memory.init': self.nothing, 'Memory.peek': self.peek, 'Memory.poke': self.poke,
+            'Memory.alloc': self.alloc, 'Memory.deAlloc': self.de_alloc,
+            'Array.new': self.alloc, 'Array.dispose': self.de_alloc,
+            'Math.init': self.nothing, 'Math.abs': self.abs, 'Math.multiply': self.multiply,
+            'Math.divide': self.divide, 'Math.min': min, 'Math.max': max, 'Math.sqrt': self.sqrt,
+            'String.new': self.string_new, 'String.dispose': self.de_alloc,
+            'String.length': self.string_length, 'String.charAt': self.char_at,
+            'String.setCharAt': self.set_char_at, 'String.appendChar': self.append_char,
+            'String.eraseLastChar': self.erase_last_char, 'String.intValue': self.int_value,
+            'String.setInt': self.set_int, 'String.newLine': lambda: NEW_LINE,
+            'String.backSpace': lambda: BACKSPACE, 'String.doubleQuote': lambda: DOUBLE_QUOTE,
+            'Output.init': self.nothing, 'Output.moveCursor': self.nothing,
+            'Output.printChar': self.print_char, 'Output.printString': self.print_string,
+            'Output.printInt': self.print_int, 'Output.println': self.println,
+            'Output.backSpace': self.back_space,
+            'Sys.init': self.nothing, 'Sys.halt': self.halt, 'Sys.error': self.error,
+            'Sys.wait': self.nothing,
+            'Keyboard.init': self.nothing, 'Keyboard.keyPressed': lambda: 0,
+        }
+        for name in ('init', 'clearScreen', 'setColor', 'drawPixel', 'drawLine',
+                     'drawRectangle', 'drawCircle'):
+            table['Screen.' + name] = self.nothing
+        return table
+
+    # Sys
+    def nothing(self, *args):
+        return 0
+
+    def halt(self):
+        raise _Halt()
+
+    def error(self, code):
+        raise VMError(f"Sys.error({code})")
+
+    # Memory
+    def peek(self, address):
+        return self.ram[address]
+
+    def poke(self, address, value):
+        self.ram[address] = value
+        return 0
+
+    def alloc(self, size):
+        if size < 0:
+            self.error(5)
+        size = max(size, 1)
+        blocks = self.free_blocks.get(size)
+        if blocks:
+            address = blocks.pop()
+        else:
+            address = self.heap_top
+            if address + size > HEAP_END:
+                self.error(6)
+            self.heap_top += size
+        self.block_sizes[address] = size
+        self.ram[address:address + size] = [0] * size
+        return address
+
+    def de_alloc(self, address):
+        size = self.block_sizes.pop(address, None)
+        if size is not None:
+            self.free_blocks.setdefault(size, []).append(address)
+        return 0
+
+    # Math
+    def abs(self, x):
+        return to_word(abs(x))
+
+    def multiply(self, x, y):
+        return to_word(x * y)
+
+    def divide(self, x, y):
+        if y == 0:
+            self.error(3)
+        quotient = abs(x) // abs(y)
+        return to_word(-quotient if (x < 0) != (y < 0) else quotient)
+
+    def sqrt(self, x):
+        if x < 0:
+            self.error(4)
+        return math.isqrt(x)
+
+    # String
+    def string_new(self, max_length):
+        if max_length < 0:
+            self.error(14)
+        string = self.alloc(max_length + 2)
+        self.ram[string] = max_length
+        return string
+
+    def string_length(self, string):
+        return self.ram[string + 1]
+
+    def char_at(self, string, index):
+        if not 0 <= index < self.ram[string + 1]:
+            self.error(15)
+        return self.ram[string + 2 + index]
+
+    def set_char_at(self, string, index, char):
+        if not 0 <= index < self.ram[string + 1]:
+            self.error(16)
+        self.ram[string + 2 + index] = char
+        return 0
+
+    def append_char(self, string, char):
+        ram = self.ram
+        length = ram[string + 1]
+        if length >= ram[string]:
+            self.error(17)
+        ram[string + 2 + length] = char
+        ram[string + 1] = length + 1
+        return string
+
+    def erase_last_char(self, string):
+        if self.ram[string + 1] == 0:
+            self.error(18)
+        self.ram[string + 1] -= 1
+        return 0
+
+    def text(self, string):
+        length = self.ram[string + 1]
+        return self.ram[string + 2:string + 2 + length]
+
+    def int_value(self, string):
+        chars = self.text(string)
+        sign = 1
+        if chars and chars[0] == ord('-'):
+            sign = -1
+            chars = chars[1:]
+        value = 0
+        for char in chars:
+            if not ord('0') <= char <= ord('9'):
+                break
+            value = value * 10 + char - ord('0')
+        return to_word(sign * value)
+
+    def set_int(self, string, value):
+        digits = [ord(c) for c in str(value)]
+        if len(digits) > self.ram[string]:
+            self.error(19)
+        self.ram[string + 2:string + 2 + len(digits)] = digits
+        self.ram[string + 1] = len(digits)
+        return 0
+
+    # Output
+    def print_char(self, char):
+        if char == NEW_LINE:
+            self.output.append('\n')
+        elif char == BACKSPACE:
+            self.back_space()
+        else:
+            self.output.append(chr(char))
+        return 0
+
+    def print_string(self, string):
+        for char in self.text(string):
+            self.print_char(char)
+        return 0
+
+    def print_int(self, value):
+        self.output.append(str(value))
+        return 0
+
+    def println(self):
+        self.output.append('\n')
+        return 0
+
+    def back_space(self):
+        if self.output:
+            self.output.pop()
+        return 0
+
+
+class VMInterpreter:
+    """
+    Runs VM code headlessly, with the Jack OS replaced by JackOS.
+    The VMFunctions are decoded once into one flat array of
+    (operation, a, b) tuples with jump targets and call targets resolved,
+    then run on a Hack-like RAM with the standard stack frame layout.
+    Counts the instructions executed (labels generate no code, so they are
+    not counted) and the calls made, per function.
+    """
+
+    def __init__(self, functions, max_jumps=None):
+        """
+        :param functions: VMFunctions of the whole program (e.g. from
+                          VMCode.parse or an IRWriter); a function defined
+                          here replaces the JackOS stand-in of the same name
+        :param max_jumps: Stop with a VMError after this many jumps and calls,
+                          to catch programs that never halt (None = no limit)
+        """
+        self.max_jumps = max_jumps
+        self.ram = [0] * RAM_SIZE
+        self.os = JackOS(self.ram)
+        # 'Class.name' -> index in self.names / self.entries
+        self.index = {}
+        self.names = []
+        # per function: (first pc, number of locals, Python stand-in or None)
+        self.entries = []
+        self.code = []
+        # per function: end pc, so pcs map back to functions
+        self.ends = []
+        self.hits = []
+        self.calls = []
+        self.decode(functions)
+
+    @classmethod
+    def load(cls, path, **options):
+        """
+        Creates an interpreter for a .vm file or a directory of .vm files.
+        """
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.vm')]
+        else:
+            paths = [path]
+        functions = []
+        for vm_path in paths:
+            with open(vm_path, 'r') as f:
+                functions.extend(parse(f.read(), vm_path))
+        return cls(functions, **options)
+
+    def decode(self, functions):
+        stand_ins = self.os.functions()
+        for function in functions:
+            self._function_index(function.name)
+
+        # Each class's statics get their own block from STATIC_BASE up
+        static_counts = {}
+        for function in functions:
+            class_name = function.name.split('.')[0]
+            for instruction in function.code:
+                if instruction.op in (PUSH, POP) and instruction.arg1 == STATIC:
+                    static_counts[class_name] = max(static_counts.get(class_name, 0), instruction.arg2 + 1)
+        static_bases = {}
+        address = STATIC_BASE
+        for class_name, count in static_counts.items():
+            static_bases[class_name] = address
+            address += count
+        if address > STACK_BASE:
+            raise VMError(f"{address - STATIC_BASE} static variables do not fit in RAM[16..255]")
+
+        for function in functions:
+            static_base = static_bases.get(function.name.split('.')[0], STATIC_BASE)
+            # labels resolve to the next real instruction
+            labels = {}
+            pc = len(self.code)
+            for instruction in function.code:
+                if instruction.op == LABEL:
+                    labels[instruction.arg1] = pc
+                else:
+                    pc += 1
+            start = len(self.code)
+            for instruction in function.code:
+                op = instruction.op
+                if op == LABEL:
+                    continue
+                self.code.append(self._decode(instruction, function.name, labels, static_base))
+            self.entries[self.index[function.name]] = (start, function.n_locals, None)
+            self.ends.append((len(self.code), self.index[function.name]))
+
+        for i, name in enumerate(self.names):
+            if self.entries[i] is None:
+                stand_in = stand_ins.get(name)
+                if stand_in is None:
+                    stand_in = self._undefined(name)
+                self.entries[i] = (None, 0, stand_in)
+        self.hits = [0] * len(self.code)
+        self.calls = [0] * len(self.names)
+
+    def _function_index(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.entries.append(None)
+        return index
+
+    def _decode(self, instruction, function_name, labels, static_base):
+        op, arg1, arg2 = instruction.op, instruction.arg1, instruction.arg2
+        if op == PUSH:
+            if arg1 == CONSTANT:
+                return PUSH_CONSTANT, arg2, None
+            if arg1 in _PUSH_OPS:
+                return _PUSH_OPS[arg1], arg2, None
+            return PUSH_ADDRESS, self._address(arg1, arg2, static_base), None
+        if op == POP:
+            if arg1 in _POP_OPS:
+                return _POP_OPS[arg1], arg2, None
+            if arg1 == CONSTANT:
+                raise VMError(f"{function_name}: cannot pop to constant")
+            return POP_ADDRESS, self._address(arg1, arg2, static_base), None
+        if op == ARITHMETIC:
+            return _ARITHMETIC_OPS[arg1], None, None
+        if op == GOTO or op == IF_GOTO:
+            if arg1 not in labels:
+                raise VMError(f"{function_name}: undefined label {arg1}")
+            return (OP_GOTO if op == GOTO else OP_IF_GOTO), labels[arg1], None
+        if op == CALL:
+            return OP_CALL, self._function_index(arg1), arg2
+        return OP_RETURN, None, None
+
+    @staticmethod
+    def _address(segment, index, static_base):
+        if segment == TEMP:
+            return TEMP_BASE + index
+        if segment == POINTER:
+            return THIS_POINTER + index
+        return static_base + index
+
+    @staticmethod
+    def _undefined(name):
+        def undefined(*args):
+            raise VMError(f"call to undefined function {name}")
+        return undefined
+
+    @property
+    def output(self):
+        """ Everything the program printed through Output. """
+        return ''.join(self.os.output)
+
+    def run(self, entry=None):
+        """
+        Runs the program from entry, by default Sys.init if the program
+        defines it, else Main.main.
+        :return: The value entry returned, or None if the program called Sys.halt
+        """
+        if entry is None:
+            sys_init = self.index.get('Sys.init')
+            entry = 'Sys.init' if sys_init is not None and self.entries[sys_init][0] is not None else 'Main.main'
+        if entry not in self.index or self.entries[self.index[entry]][0] is None:
+            raise VMError(f"no function {entry}")
+        try:
+            return self._execute(self.index[entry])
+        except _Halt:
+            return None
+        except IndexError:
+            raise VMError("stack overflow or address out of RAM") from None
+        except RecursionError:
+            raise VMError("stack overflow") from None
+
+    def _execute(self, function_index):
+        ram = self.ram
+        code = self.code
+        hits = self.hits
+        calls = self.calls
+        entries = self.entries
+        jumps_left = self.max_jumps if self.max_jumps is not None else -1
+
+        # A frame for entry as if called with no arguments, returning to pc -1
+        sp = STACK_BASE
+        ram[sp:sp + 5] = [-1, 0, 0, 0, 0]
+        arg = sp
+        sp += 5
+        pc, n_locals, _ = entries[function_index]
+        calls[function_index] += 1
+        lcl = sp
+        ram[sp:sp + n_locals] = [0] * n_locals
+        sp += n_locals
+
+        while True:
+            op, a, b = code[pc]
+            hits[pc] += 1
+            pc += 1
+            if op == PUSH_CONSTANT:
+                ram[sp] = a
+                sp += 1
+            elif op == PUSH_LOCAL:
+                ram[sp] = ram[lcl + a]
+                sp += 1
+            elif op == PUSH_ARGUMENT:
+                ram[sp] = ram[arg + a]
+                sp += 1
+            elif op == POP_LOCAL:
+                sp -= 1
+                ram[lcl + a] = ram[sp]
+            elif op == OP_ADD:
+                sp -= 1
+                value = ram[sp - 1] + ram[sp]
+                ram[sp - 1] = value if -32768 <= value <= 32767 else to_word(value)
+            elif op == OP_IF_GOTO:
+                sp -= 1
+                if ram[sp] != 0:
+                    pc = a
+                    if jumps_left == 0:
+                        raise VMError("jump limit reached")
+                    jumps_left -= 1
+            elif op == OP_GOTO:
+                pc = a
+                if jumps_left == 0:
+                    raise VMError("jump limit reached")
+                jumps_left -= 1
+            elif op == PUSH_THIS:
+                ram[sp] = ram[ram[THIS_POINTER] + a]
+                sp += 1
+            elif op == PUSH_THAT:
+                ram[sp] = ram[ram[THAT_POINTER] + a]
+                sp += 1
+            elif op == PUSH_ADDRESS:
+                ram[sp] = ram[a]
+                sp += 1
+            elif op == POP_ADDRESS:
+                sp -= 1
+                ram[a] = ram[sp]
+            elif op == POP_THIS:
+                sp -= 1
+                ram[ram[THIS_POINTER] + a] = ram[sp]
+            elif op == POP_THAT:
+                sp -= 1
+                ram[ram[THAT_POINTER] + a] = ram[sp]
+            elif op == POP_ARGUMENT:
+                sp -= 1
+                ram[arg + a] = ram[sp]
+            elif op == OP_SUB:
+                sp -= 1
+                value = ram[sp - 1] - ram[sp]
+                ram[sp - 1] = value if -32768 <= value <= 32767 else to_word(value)
+            elif op == OP_LT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+            elif op == OP_GT:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+            elif op == OP_EQ:
+                sp -= 1
+                ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+            elif op == OP_NOT:
+                ram[sp - 1] = ~ram[sp - 1]
+            elif op == OP_NEG:
+                ram[sp - 1] = to_word(-ram[sp - 1])
+            elif op == OP_AND:
+                sp -= 1
+                ram[sp - 1] &= ram[sp]
+            elif op == OP_OR:
+                sp -= 1
+                ram[sp - 1] |= ram[sp]
+            elif op == OP_CALL:
+                calls[a] += 1
+                if jumps_left == 0:
+                    raise VMError("jump limit reached")
+                jumps_left -= 1
+                entry, n_locals, stand_in = entries[a]
+                if stand_in is not None:
+                    ram[SP] = sp
+                    args = ram[sp - b:sp]
+                    sp -= b
+                    ram[sp] = stand_in(*args)
+                    sp += 1
+                    continue
+                # return address, LCL, ARG, THIS, THAT
+                ram[sp] = pc
+                ram[sp + 1] = lcl
+                ram[sp + 2] = arg
+                ram[sp + 3] = ram[THIS_POINTER]
+                ram[sp + 4] = ram[THAT_POINTER]
+                arg = sp - b
+                sp += 5
+                lcl = sp
+                if n_locals:
+                    ram[sp:sp + n_locals] = [0] * n_locals
+                    sp += n_locals
+                if sp >= HEAP_BASE:
+                    raise VMError("stack overflow")
+                pc = entry
+            else:  # OP_RETURN
+                frame = lcl
+                pc = ram[frame - 5]
+                ram[arg] = ram[sp - 1]
+                sp = arg + 1
+                ram[THAT_POINTER] = ram[frame - 1]
+                ram[THIS_POINTER] = ram[frame - 2]
+                arg = ram[frame - 3]
+                lcl = ram[frame - 4]
+                if pc < 0:
+                    return ram[sp - 1]
+
+    def counts(self):
+        """
+        {'Class.name': {'instructions': executed, 'calls': times called}}
+        for every function called or defined, OS stand-ins included.
+        """
+        result = {name: {'instructions': 0, 'calls': self.calls[i]} for i, name in enumerate(self.names)}
+        start = 0
+        for end, index in self.ends:
+            result[self.names[index]]['instructions'] = sum(self.hits[start:end])
+            start = end
+        return {name: count for name, count in result.items()
+                if count['calls'] or self.entries[self.index[name]][0] is not None}
+
+    def instructions_executed(self):
+        """ Total VM instructions executed, labels excluded. """
+        return sum(self.hits)
+
+
+def main():
+    # Usage: python VMInterpreter.py path/to/Program.vm
+    #    or: python VMInterpreter.py path/to/DirectoryOfVmFiles [--counts]
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Run VM code with Python stand-ins for the Jack OS.")
+    parser.add_argument('path', help="a .vm file or a directory of .vm files")
+    parser.add_argument('--entry', help="function to start in (default Sys.init if defined, else Main.main)")
+    parser.add_argument('--max-jumps', type=int, help="stop after this many jumps and calls")
+    parser.add_argument('--counts', action='store_true',
+                        help="print executed instructions and calls per function as JSON to stderr")
+    args = parser.parse_args()
+
+    interpreter = VMInterpreter.load(args.path, max_jumps=args.max_jumps)
+    try:
+        interpreter.run(args.entry)
+    except VMError as e:
+        sys.stdout.write(interpreter.output)
+        print(f"\nerror: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.counts:
+            print(json.dumps(interpreter.counts(), indent=1), file=sys.stderr)
+    sys.stdout.write(interpreter.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+from VMCode import (Instruction, PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL, RETURN,
+                    CONSTANT, ARGUMENT, LOCAL, THAT, POINTER, TEMP, ADD, SUB, NEG, EQ, OR, NOT)
+
+# ---------------------------------------------------------
+# Peephole rewrite rules
+# ---------------------------------------------------------
+# Each rule looks at a window of consecutive instructions and returns the
+# instructions to replace it with, or None if it does not apply. A window
+# has a label only as its last instruction, so no jump lands inside one.
+
+
+def _is_push_constant(instruction, value=None):
+    return (instruction.op == PUSH and instruction.arg1 == CONSTANT
+            and (value is None or instruction.arg2 == value))
+
+
+def _is_arithmetic(instruction, command):
+    return instruction.op == ARITHMETIC and instruction.arg1 == command
+
+
+def _cancel_double_unary(window):
+    """ not; not  or  neg; neg  => nothing """
+    a, b = window
+    if a.op == ARITHMETIC and a.arg1 in (NOT, NEG) and _is_arithmetic(b, a.arg1):
+        return []
+    return None
+
+
+def _push_pop_same(window):
+    """ push S i; pop S i  => nothing """
+    a, b = window
+    if a.op == PUSH and b.op == POP and a.arg1 == b.arg1 and a.arg2 == b.arg2:
+        return []
+    return None
+
+
+def _add_zero(window):
+    """ push constant 0; add|sub|or  => nothing """
+    a, b = window
+    if _is_push_constant(a, 0) and b.op == ARITHMETIC and b.arg1 in (ADD, SUB, OR):
+        return []
+    return None
+
+
+def _constant_branch(window):
+    """ push constant c; if-goto L  => goto L if c else nothing """
+    a, b = window
+    if _is_push_constant(a) and b.op == IF_GOTO:
+        return [Instruction(GOTO, b.arg1)] if a.arg2 != 0 else []
+    return None
+
+
+def _true_branch(window):
+    """ push constant 0; not; if-goto L  => goto L """
+    a, b, c = window
+    if _is_push_constant(a, 0) and _is_arithmetic(b, NOT) and c.op == IF_GOTO:
+        return [Instruction(GOTO, c.arg1)]
+    return None
+
+
+def _not_equal_branch(window):
+    """ eq; not; if-goto L  => sub; if-goto L  (x != y exactly when x - y != 0) """
+    a, b, c = window
+    if _is_arithmetic(a, EQ) and _is_arithmetic(b, NOT) and c.op == IF_GOTO:
+        return [Instruction(ARITHMETIC, SUB), c]
+    return None
+
+
+def _direct_array_store(window):
+    """
+    push X; pop temp 0; pop pointer 1; push temp 0; pop that 0
+      => pop pointer 1; push X; pop that 0
+    X must not read 'that' or 'pointer', which the reordering changes.
+    """
+    a, b, c, d, e = window
+    if (a.op == PUSH and a.arg1 not in (THAT, POINTER)
+            and b.op == POP and b.arg1 == TEMP and b.arg2 == 0
+            and c.op == POP and c.arg1 == POINTER and c.arg2 == 1
+            and d.op == PUSH and d.arg1 == TEMP and d.arg2 == 0
+            and e.op == POP and e.arg1 == THAT and e.arg2 == 0):
+        return [c, a, e]
+    return None
+
+
+def _goto_next(window):
+    """ goto L; label L  => label L """
+    a, b = window
+    if a.op == GOTO and b.op == LABEL and a.arg1 == b.arg1:
+        return [b]
+    return None
+
+
+# (window size, rule)
+PEEPHOLE_RULES = (
+    (2, _cancel_double_unary),
+    (2, _push_pop_same),
+    (2, _add_zero),
+    (2, _constant_branch),
+    (3, _true_branch),
+    (3, _not_equal_branch),
+    (5, _direct_array_store),
+    (2, _goto_next),
+)
+MAX_WINDOW = max(size for size, _ in PEEPHOLE_RULES)
+
+# The rules that can match a window starting with each pair of ops, in
+# PEEPHOLE_RULES order
+RULES_BY_OPS = {
+    (ARITHMETIC, ARITHMETIC): ((2, _cancel_double_unary), (3, _not_equal_branch)),
+    (PUSH, POP): ((2, _push_pop_same), (5, _direct_array_store)),
+    (PUSH, ARITHMETIC): ((2, _add_zero), (3, _true_branch)),
+    (PUSH, IF_GOTO): ((2, _constant_branch),),
+    (GOTO, LABEL): ((2, _goto_next),),
+}
+
+
+def _apply_rules(code):
+    """ One sweep of PEEPHOLE_RULES over code. Returns True if anything changed. """
+    changed = False
+    kept = []
+    # Instructions still to look at, the next one last
+    pending = code[::-1]
+    while len(pending) > 1:
+        rules = RULES_BY_OPS.get((pending[-1].op, pending[-2].op))
+        if rules is not None:
+            # The longest window from here with a label, if any, only at its end
+            size = 2
+            while size < MAX_WINDOW and size < len(pending) and pending[-size].op != LABEL:
+                size += 1
+            for rule_size, rule in rules:
+                if rule_size > size:
+                    continue
+                replacement = rule(pending[:-rule_size - 1:-1])
+                if replacement is not None:
+                    del pending[-rule_size:]
+                    pending.extend(reversed(replacement))
+                    # Look again at the instructions before, so a rewrite
+                    # can complete an earlier pattern
+                    back = min(len(kept), MAX_WINDOW - 1)
+                    if back:
+                        pending.extend(reversed(kept[-back:]))
+                        del kept[-back:]
+                    changed = True
+                    break
+            else:
+                kept.append(pending.pop())
+        else:
+            kept.append(pending.pop())
+    if changed:
+        code[:] = kept + pending
+    return changed
+
+
+def _remove_unreachable(code):
+    """
+    Drops instructions after a goto or return up to the next label, and
+    labels that nothing jumps to. Returns True if anything changed.
+    """
+    targets = {instruction.arg1 for instruction in code if instruction.op in (GOTO, IF_GOTO)}
+    kept = []
+    reachable = True
+    for instruction in code:
+        if instruction.op == LABEL:
+            if instruction.arg1 not in targets:
+                continue
+            reachable = True
+        if reachable:
+            kept.append(instruction)
+            if instruction.op in (GOTO, RETURN):
+                reachable = False
+    if len(kept) == len(code):
+        return False
+    code[:] = kept
+    return True
+
+
+def peephole(function):
+    """
+    Rewrites function.code in place with PEEPHOLE_RULES and dead-code
+    removal until nothing changes.
+    :return: Number of instructions removed
+    """
+    code = function.code
+    before = len(code)
+    while True:
+        while _remove_unreachable(code):
+            pass
+        # A sweep leaves nothing that any rule applies to, so another one is
+        # only needed once removing dead code changes the instructions again
+        if not _apply_rules(code) or not _remove_unreachable(code):
+            break
+    return before - len(code)
+
+
+# Where a function whose self tail calls became jumps starts over
+TAIL_CALL_LABEL = 'TAIL_CALL'
+
+
+def self_tail_calls(function, n_args):
+    """
+    Rewrites each 'call <function> n_args; return' in function.code into
+    pops of the new arguments into the argument segment, zeroing the locals
+    as a fresh call would, and a goto back to the start of the function, so
+    the recursion runs in one frame. Must not be used on constructors,
+    whose start allocates a new object. A method starts over from setting
+    'this' to argument 0, so a tail call on another object works too.
+    :param n_args: Number of arguments the function takes (with 'this' for a method)
+    :return: Number of calls rewritten
+    """
+    code = function.code
+    restart = [Instruction(POP, ARGUMENT, index) for index in reversed(range(n_args))]
+    for index in range(function.n_locals):
+        restart += [Instruction(PUSH, CONSTANT, 0), Instruction(POP, LOCAL, index)]
+    restart.append(Instruction(GOTO, TAIL_CALL_LABEL))
+
+    rewritten = 0
+    i = 0
+    while i < len(code) - 1:
+        call = code[i]
+        if (call.op == CALL and call.arg1 == function.name and call.arg2 == n_args
+                and code[i + 1].op == RETURN):
+            code[i:i + 2] = restart
+            i += len(restart)
+            rewritten += 1
+        else:
+            i += 1
+    if rewritten:
+        code.insert(0, Instruction(LABEL, TAIL_CALL_LABEL))
+    return rewritten
+
+
+# ---------------------------------------------------------
+# Whole-program passes
+# ---------------------------------------------------------
+
+def reachable_functions(functions, roots):
+    """
+    Walks the call graph given by the 'call' instructions in functions.
+    :param functions: {name: VMFunction} for every function of the program
+    :param roots: Names of the functions the program may start in; names
+                  not in functions are ignored
+    :return: The set of names of the functions reachable from roots; calls
+             to functions outside the program (the OS) are not followed
+    """
+    reached = set()
+    pending = [name for name in roots if name in functions]
+    while pending:
+        name = pending.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        for instruction in functions[name].code:
+            if instruction.op == CALL and instruction.arg1 in functions and instruction.arg1 not in reached:
+                pending.append(instruction.arg1)
+    return reached
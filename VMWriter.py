@@ -1,37 +1,123 @@
+import sys
+from VMCode import (Instruction, VMFunction, serialize, PUSH, POP, ARITHMETIC, LABEL, GOTO,
+                    IF_GOTO, CALL, RETURN, SEGMENT_CODES, ARITHMETIC_CODES)
+
+
 class VMWriter:
     """
     Writes VM commands to an output .vm file.
     """
-    def __init__(self, output_file):
-        self.output = open(output_file, 'w')
+    def __init__(self, output_file, buffered=False):
+        """
+        :param output_file: Path of the .vm file, or None to keep the output
+                            in memory only (see getvalue())
+        :param buffered: Collect the commands in memory and write the file
+                         in one bulk write on close()
+        """
+        self.output_file = output_file
+        self.parts = None
+        if output_file is None or buffered:
+            self.output = None
+            self.parts = []
+            self._write = self.parts.append
+        else:
+            self.output = open(output_file, 'w')
+            self._write = self.output.write
 
     def writePush(self, segment, index):
-        self.output.write(f"push {segment} {index}\n")
+        self._write(f"push {segment} {index}\n")
 
     def writePop(self, segment, index):
-        self.output.write(f"pop {segment} {index}\n")
+        self._write(f"pop {segment} {index}\n")
 
     def writeArithmetic(self, command):
         # e.g. add, sub, neg, eq, gt, lt, and, or, not
-        self.output.write(f"{command}\n")
+        self._write(f"{command}\n")
+
+    def writeLabel(self, label):
+        self._write(f"label {label}\n")
+
+    def writeGoto(self, label):
+        self._write(f"goto {label}\n")
+
+    def writeIf(self, label):
+        self._write(f"if-goto {label}\n")
+
+    def writeCall(self, name, nArgs):
+        self._write(f"call {name} {nArgs}\n")
+
+    def writeFunction(self, name, nLocals):
+        self._write(f"function {name} {nLocals}\n")
+
+    def writeReturn(self):
+        self._write("return\n")
+
+    def getvalue(self):
+        """
+        Returns the VM code written so far (buffered or in-memory mode only).
+        """
+        return ''.join(self.parts)
+
+    def close(self):
+        if self.output is not None:
+            self.output.close()
+        elif self.output_file is not None:
+            with open(self.output_file, 'w') as f:
+                f.write(self.getvalue())
+
+
+class IRWriter(VMWriter):
+    """
+    A VMWriter that records compact Instructions (see VMCode), grouped per
+    function in self.functions, instead of formatting text. Later passes can
+    inspect and rewrite them; close() serializes them to the .vm file.
+    """
+    def __init__(self, output_file):
+        """
+        :param output_file: Path of the .vm file, or None to keep the
+                            instructions in memory only
+        """
+        self.output_file = output_file
+        self.functions = []
+        # Instruction list of the function being written
+        self.code = None
+
+    def writePush(self, segment, index):
+        self.code.append(Instruction(PUSH, SEGMENT_CODES[segment], index))
+
+    def writePop(self, segment, index):
+        self.code.append(Instruction(POP, SEGMENT_CODES[segment], index))
+
+    def writeArithmetic(self, command):
+        self.code.append(Instruction(ARITHMETIC, ARITHMETIC_CODES[command]))
 
     def writeLabel(self, label):
-        self.output.write(f"label {label}\n")
+        self.code.append(Instruction(LABEL, sys.intern(label)))
 
     def writeGoto(self, label):
-        self.output.write(f"goto {label}\n")
+        self.code.append(Instruction(GOTO, sys.intern(label)))
 
     def writeIf(self, label):
-        self.output.write(f"if-goto {label}\n")
+        self.code.append(Instruction(IF_GOTO, sys.intern(label)))
 
     def writeCall(self, name, nArgs):
-        self.output.write(f"call {name} {nArgs}\n")
+        self.code.append(Instruction(CALL, sys.intern(name), nArgs))
 
     def writeFunction(self, name, nLocals):
-        self.output.write(f"function {name} {nLocals}\n")
+        function = VMFunction(name, nLocals)
+        self.functions.append(function)
+        self.code = function.code
 
     def writeReturn(self):
-        self.output.write("return\n")
+        self.code.append(Instruction(RETURN))
+
+    def getvalue(self):
+        """
+        Returns the VM code written so far, serialized to text.
+        """
+        return serialize(self.functions)
 
     def close(self):
-        self.output.close()
+        if self.output_file is not None:
+            with open(self.output_file, 'w') as f:
+                f.write(self.getvalue())
@@ -0,0 +1,120 @@
+"""
+Executed-instruction benchmark for the 'loops' optimization (while loops
+rotated to test at the bottom). Loop-heavy Jack programs are compiled with
+and without it and run on the VMInterpreter, which counts every executed
+instruction (labels excluded).
+
+Usage: python benchmarks/bench_loops.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from CompilationEngine import CompilationEngine  # noqa: E402
+from JackCompiler import DEFAULT_OPTIMIZATIONS  # noqa: E402
+from VMInterpreter import VMInterpreter  # noqa: E402
+
+PROGRAMS = {
+    'nested': '''
+class Main {
+    function int main() {
+        var int i, j, sum;
+        let i = 0;
+        while (i < 100) {
+            let j = 0;
+            while (j < 100) {
+                let sum = sum + 1;
+                let j = j + 1;
+            }
+            let i = i + 1;
+        }
+        return sum;
+    }
+}
+''',
+    'gcd': '''
+class Main {
+    function int gcd(int a, int b) {
+        while (~(a = b)) {
+            if (a > b) { let a = a - b; } else { let b = b - a; }
+        }
+        return a;
+    }
+    function int main() {
+        var int n, total;
+        let n = 1;
+        while (n < 200) {
+            let total = total + Main.gcd(n + 300, 7 + n + n);
+            let n = n + 1;
+        }
+        return total;
+    }
+}
+''',
+    'fibonacci': '''
+class Main {
+    function int main() {
+        var int round, k, a, b, t;
+        let round = 0;
+        while (round < 300) {
+            let a = 0;
+            let b = 1;
+            let k = 0;
+            while (k < 20) {
+                let t = a + b;
+                let a = b;
+                let b = t;
+                let k = k + 1;
+            }
+            let round = round + 1;
+        }
+        return a;
+    }
+}
+''',
+}
+
+
+def execute(functions, entry='Main.main'):
+    """ Run compiled VMFunctions from entry, returning (result, executed count). """
+    interpreter = VMInterpreter(functions)
+    result = interpreter.run(entry)
+    return result, interpreter.instructions_executed()
+
+
+def compile_program(source, optimizations):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Main.jack')
+        with open(path, 'w') as f:
+            f.write(source)
+        engine = CompilationEngine(path, None, ir=True, optimizations=optimizations)
+        engine.compile_class()
+        engine.close()
+    return engine.vm_writer.functions
+
+
+def main():
+    configurations = (
+        ("plain", ()),
+        ("loops", ('loops',)),
+        ("-O without loops", tuple(name for name in DEFAULT_OPTIMIZATIONS if name != 'loops')),
+        ("-O", DEFAULT_OPTIMIZATIONS),
+    )
+    for program, source in PROGRAMS.items():
+        print(f"{program}:")
+        baseline = None
+        for name, optimizations in configurations:
+            result, executed = execute(compile_program(source, optimizations))
+            if baseline is None:
+                baseline = (result, executed)
+            elif result != baseline[0]:
+                print(f"  {name}: result {result} differs from {baseline[0]}!")
+                sys.exit(1)
+            saved = 100.0 * (baseline[1] - executed) / baseline[1]
+            print(f"  {name:>16}: {executed:>9,} instructions executed ({saved:5.1f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
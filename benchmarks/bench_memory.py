@@ -0,0 +1,109 @@
+"""
+Peak-memory benchmark for tokenizing a multi-MB .jack file: comment
+stripping fused into the scan against the original remove_comments passes
+(block-comment re.sub, split into lines, split on //, join), plus the
+memory-mapped tokenizer that keeps only token offsets and the streaming
+tokenizer that never builds the token lists.
+
+Each variant runs in a fresh interpreter so its peak RSS is its own.
+
+Usage: python benchmarks/bench_memory.py [megabytes]
+"""
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from JackTokenizer import JackTokenizer, MappedJackTokenizer, StreamingJackTokenizer  # noqa: E402
+
+SNIPPET = '''
+/** Keeps a running total. */
+class Counter {
+    field int total;   // running total
+
+    /* Adds n to the total
+       and returns the new value. */
+    method int add(int n) {
+        let total = total + n;   // no overflow check
+        do Output.printString("added");
+        return total;
+    }
+}
+'''
+
+
+def legacy_remove_comments(input_file):
+    """ The original multi-pass comment stripping. """
+    with open(input_file, 'r') as f:
+        text = f.read()
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+    cleaned_lines = []
+    for line in text.split('\n'):
+        line = line.split('//')[0]
+        cleaned_lines.append(line)
+    return '\n'.join(cleaned_lines)
+
+
+class LegacyTokenizer(JackTokenizer):
+    def cleanAndTokenize(self, input_file):
+        return self.scan(legacy_remove_comments(input_file))
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_variant(variant, path):
+    """ Child side: tokenize path with the given variant and print peak RSS. """
+    if variant == 'legacy':
+        tokenizer = LegacyTokenizer(path)
+    elif variant == 'fused':
+        tokenizer = JackTokenizer(path)
+    elif variant == 'mmap':
+        tokenizer = MappedJackTokenizer(path)
+    elif variant == 'stream':
+        tokenizer = StreamingJackTokenizer(path)
+        while tokenizer.hasMoreTokens():
+            tokenizer.advance()
+    else:
+        tokenizer = None
+    if tokenizer is None:
+        n_tokens = 0
+    elif variant == 'stream':
+        n_tokens = tokenizer.currentTokenIndex + 1
+    else:
+        n_tokens = tokenizer.tokenLength
+    print(peak_rss_kb(), n_tokens)
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_variant(sys.argv[2], sys.argv[3])
+        return
+
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    copies = int(megabytes * 1024 * 1024 / len(SNIPPET)) + 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Big.jack')
+        # Written piecewise: a forked child starts from the parent's peak RSS.
+        with open(path, 'w') as f:
+            for _ in range(copies):
+                f.write(SNIPPET)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"input: {size_mb:.1f} MB")
+
+        for variant in ('baseline', 'legacy', 'fused', 'mmap', 'stream'):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', variant, path],
+                                 check=True, capture_output=True, text=True).stdout.split()
+            print(f"{variant:>8}: peak RSS {int(out[0]) / 1024:8.1f} MB  ({out[1]} tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark suite over generated corpora (see gen_corpus.py): times the
+tokenizer, the compilation engine, the VMWriter and the whole JackCompiler
+separately, and reports tokens/sec, lines/sec and peak memory as JSON, so
+runs before and after a change can be compared.
+
+Each phase runs in a fresh interpreter so its peak RSS is its own; its time
+is the best of the repeats.
+  tokenizer:  JackTokenizer over every file
+  engine:     CompilationEngine.compile_class (tokenizing included), writing to memory
+  writer:     replaying the compiled commands into a buffered VMWriter
+  end-to-end: JackCompiler.analyze() without the build cache, -O if asked
+
+Usage: python benchmarks/bench_suite.py [--profile NAME ...] [--repeats N]
+                                        [--seed N] [--optimize] [--output FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from gen_corpus import PROFILES, generate  # noqa: E402
+
+PHASES = ('tokenizer', 'engine', 'writer', 'end-to-end')
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def jack_files(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.jack')]
+
+
+def replay(functions, writer):
+    """ Writes IR functions through the VMWriter API, as the engine would. """
+    from VMCode import (PUSH, POP, ARITHMETIC, LABEL, GOTO, IF_GOTO, CALL,
+                        SEGMENTS, ARITHMETIC_COMMANDS)
+    for function in functions:
+        writer.writeFunction(function.name, function.n_locals)
+        for instruction in function.code:
+            op = instruction.op
+            if op == PUSH:
+                writer.writePush(SEGMENTS[instruction.arg1], instruction.arg2)
+            elif op == POP:
+                writer.writePop(SEGMENTS[instruction.arg1], instruction.arg2)
+            elif op == ARITHMETIC:
+                writer.writeArithmetic(ARITHMETIC_COMMANDS[instruction.arg1])
+            elif op == LABEL:
+                writer.writeLabel(instruction.arg1)
+            elif op == GOTO:
+                writer.writeGoto(instruction.arg1)
+            elif op == IF_GOTO:
+                writer.writeIf(instruction.arg1)
+            elif op == CALL:
+                writer.writeCall(instruction.arg1, instruction.arg2)
+            else:
+                writer.writeReturn()
+    writer.close()
+
+
+def run_phase(phase, directory, repeats, optimize):
+    """
+    Child side: run one phase over the corpus in directory.
+    :return: {'seconds': best time, 'peak_rss_kb': ..., plus phase counts}
+    """
+    from CompilationEngine import CompilationEngine
+    from JackCompiler import DEFAULT_OPTIMIZATIONS, JackCompiler
+    from JackTokenizer import JackTokenizer
+    from VMWriter import VMWriter
+
+    paths = jack_files(directory)
+    result = {}
+
+    if phase == 'tokenizer':
+        def run():
+            result['tokens'] = sum(JackTokenizer(path).tokenLength for path in paths)
+    elif phase == 'engine':
+        def run():
+            for path in paths:
+                engine = CompilationEngine(path, None)
+                engine.compile_class()
+                engine.close()
+    elif phase == 'writer':
+        compiled = []
+        for path in paths:
+            engine = CompilationEngine(path, None, ir=True)
+            engine.compile_class()
+            compiled.append((path[:-5] + '.vm', engine.vm_writer.functions))
+        result['commands'] = sum(len(f.code) + 1 for _, functions in compiled for f in functions)
+
+        def run():
+            for vm_path, functions in compiled:
+                replay(functions, VMWriter(vm_path, buffered=True))
+    else:
+        optimizations = DEFAULT_OPTIMIZATIONS if optimize else ()
+
+        def run():
+            errors = JackCompiler(directory, use_cache=False, optimizations=optimizations).analyze()
+            if errors:
+                raise RuntimeError(errors)
+
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    result['seconds'] = best
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def corpus_size(directory):
+    lines = size = 0
+    for path in jack_files(directory):
+        with open(path, 'rb') as f:
+            data = f.read()
+        lines += data.count(b'\n')
+        size += len(data)
+    return lines, size
+
+
+def bench_profile(profile, seed, repeats, optimize):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate(tmp, profile, seed)
+        lines, size = corpus_size(tmp)
+        report = {'files': len(paths), 'lines': lines, 'bytes': size, 'phases': {}}
+        tokens = None
+        for phase in PHASES:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', phase, tmp,
+                                  str(repeats), '1' if optimize else '0'],
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out)
+            if phase == 'tokenizer':
+                tokens = result['tokens']
+                report['tokens'] = tokens
+            seconds = result['seconds']
+            result['tokens_per_sec'] = round(tokens / seconds)
+            result['lines_per_sec'] = round(lines / seconds)
+            if 'commands' in result:
+                result['commands_per_sec'] = round(result['commands'] / seconds)
+            result['seconds'] = round(seconds, 4)
+            report['phases'][phase] = result
+            print(f"{profile:>16} {phase:>10}: {seconds:7.3f}s  {result['tokens_per_sec']:>11,} tokens/sec  "
+                  f"{result['lines_per_sec']:>9,} lines/sec  peak {result['peak_rss_kb'] / 1024:6.1f} MB",
+                  file=sys.stderr)
+        return report
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        _, _, phase, directory, repeats, optimize = sys.argv
+        print(json.dumps(run_phase(phase, directory, int(repeats), optimize == '1')))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the compiler phases on generated corpora.")
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                        help="corpus profile to run (repeatable; default: all)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help="compile with the default optimizations in the end-to-end phase")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'repeats': args.repeats,
+        'optimize': args.optimize,
+        'profiles': {},
+    }
+    for profile in args.profile or sorted(PROFILES):
+        report['profiles'][profile] = bench_profile(profile, args.seed, args.repeats, args.optimize)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
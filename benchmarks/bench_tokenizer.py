@@ -0,0 +1,115 @@
+"""
+Tokenizer throughput benchmark: the single-pass TOKEN_PATTERN scanner
+against the original character-by-character loop.
+
+Usage: python benchmarks/bench_tokenizer.py [copies] [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from JackTokenizer import JackTokenizer  # noqa: E402
+
+SNIPPET = '''
+class Point {
+    field int x, y;
+    static int pointCount;
+
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        let pointCount = pointCount + 1;
+        return this;
+    }
+
+    method int distance(Point other) {
+        var int dx, dy;
+        let dx = x - other.getX();
+        let dy = y - other.getY();
+        do Output.printString("distance computed");
+        return Math.sqrt((dx * dx) + (dy * dy));
+    }
+}
+'''
+
+
+def legacy_tokenize(text):
+    """ The original per-character loop, kept here as the baseline. """
+    symbols = set('{}()[].,;+-*/&|<>=~')
+    tokens = []
+    current_token = ''
+    inside_string = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if inside_string:
+            current_token += char
+            if char == '"':
+                tokens.append(current_token)
+                current_token = ''
+                inside_string = False
+            i += 1
+        elif char.isspace():
+            if current_token:
+                tokens.append(current_token)
+                current_token = ''
+            i += 1
+        elif char == '"':
+            if current_token:
+                tokens.append(current_token)
+            current_token = '"'
+            inside_string = True
+            i += 1
+        elif char in symbols:
+            if current_token:
+                tokens.append(current_token)
+                current_token = ''
+            tokens.append(char)
+            i += 1
+        else:
+            current_token += char
+            i += 1
+    if current_token:
+        tokens.append(current_token)
+    return tokens
+
+
+def best_time(func, text, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(text)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    text = SNIPPET * copies
+
+    # JackTokenizer.tokenize does not touch instance state, so skip __init__.
+    scanner = JackTokenizer.__new__(JackTokenizer)
+    expected = legacy_tokenize(text)
+    if scanner.tokenize(text) != expected:
+        print("token lists differ!")
+        sys.exit(1)
+
+    n_tokens = len(expected)
+    print(f"{n_tokens} tokens, {len(text)} chars")
+    variants = (
+        ("legacy loop", legacy_tokenize),
+        ("regex scanner", scanner.tokenize),
+        ("classified scan", lambda source: list(scanner.scan(source))),
+    )
+    for name, func in variants:
+        elapsed = best_time(func, text, repeats)
+        print(f"{name:>15}: {elapsed:.3f}s  {n_tokens / elapsed:,.0f} tokens/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+VMWriter throughput benchmark: one write() per command against the
+buffered mode (one bulk write on close), the in-memory mode (no file) and
+the IRWriter (Instructions serialized on close).
+The command mix is string-heavy, like compile_string_constant output.
+
+Usage: python benchmarks/bench_writer.py [commands] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from VMWriter import IRWriter, VMWriter  # noqa: E402
+
+
+def emit(writer, n_commands):
+    """ Emit about n_commands commands: a function of string appends. """
+    writer.writeFunction("Main.main", 2)
+    for i in range(n_commands // 2):
+        writer.writePush("constant", 65 + i % 26)
+        writer.writeCall("String.appendChar", 2)
+    writer.writePush("constant", 0)
+    writer.writeReturn()
+    writer.close()
+
+
+def best_time(make_writer, n_commands, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        emit(make_writer(), n_commands)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    n_commands = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Main.vm')
+        variants = (
+            ("direct", lambda: VMWriter(path)),
+            ("buffered", lambda: VMWriter(path, buffered=True)),
+            ("in-memory", lambda: VMWriter(None)),
+            ("ir", lambda: IRWriter(path)),
+        )
+        for name, make_writer in variants:
+            elapsed = best_time(make_writer, n_commands, repeats)
+            print(f"{name:>9}: {elapsed:.3f}s  {n_commands / elapsed:,.0f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Correctness check for the 'inline' optimization (trivial getters, setters
+and constant subroutines inlined at their call sites across classes). A
+Jack program calling every kind of trivial body is compiled plain, with
+'inline' alone and with -O, run on the VMInterpreter, and the printed output
+must be the same every time.
+
+The bodies cover returning a constant, an argument (the top one or one
+below it), a field and 'this', and storing an argument, a field, a constant
+or 'this' into a field, with and without other arguments around.
+
+Usage: python benchmarks/check_inline.py
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from JackCompiler import DEFAULT_OPTIMIZATIONS, JackCompiler  # noqa: E402
+from VMInterpreter import VMInterpreter  # noqa: E402
+
+CLASSES = {
+    'Point': '''
+class Point {
+    field int x, y;
+    field Point me;
+    static int count;
+    constructor Point new(int ax, int ay) { let x = ax; let y = ay; let count = count + 1; return this; }
+    method int getX() { return x; }
+    method int getY() { return y; }
+    method Point getMe() { return me; }
+    method void setX(int v) { let x = v; return; }
+    method void setBoth(int a, int b) { let y = a; return; }
+    method void setLast(int a, int b) { let y = b; return; }
+    method void copyY() { let x = y; return; }
+    method void clear() { let y = 0; return; }
+    method void link() { let me = this; return; }
+    method void linkWith(int a, int b) { let me = this; return; }
+    method Point self() { return this; }
+    method Point selfWith(int a) { return this; }
+    method int pick(int a, int b) { return a; }
+    method boolean isSet() { return true; }
+    method int dist2(Point o) { var int dx; let dx = x - o.getX(); return dx * dx; }
+    function int five() { return 5; }
+    function int first(int a, int b, int c) { return a; }
+    function int second(int a, int b, int c) { return b; }
+    function int last(int a, int b, int c) { return c; }
+    function void nop(int a, int b) { return; }
+    function int counter() { return count; }
+}
+''',
+    'Main': '''
+class Main {
+    function void show(int value) {
+        do Output.printInt(value);
+        do Output.println();
+        return;
+    }
+    function void main() {
+        var Point p, q;
+        var int i, s;
+        let p = Point.new(3, 4);
+        let q = Point.new(10, 20);
+        do p.setX(7);
+        do Main.show(p.getX());
+        do p.setBoth(1, 9);
+        do Main.show(p.getY());
+        do p.setLast(1, 9);
+        do Main.show(p.getY());
+        do Main.show(Point.five() + 1);
+        do Main.show(Point.first(11, 22, 33));
+        do Main.show(Point.second(11, 22, 33));
+        do Main.show(Point.last(11, 22, 33));
+        let q = q.self();
+        do Main.show(q.getX());
+        do Main.show(q.selfWith(8) = q);
+        do q.copyY();
+        do Main.show(q.getX());
+        do q.clear();
+        do Main.show(q.getY());
+        do p.link();
+        do Main.show(p.getMe() = p);
+        do q.linkWith(1, 2);
+        do Main.show(q.getMe() = q);
+        do Main.show(p.getMe() = q);
+        do Main.show(p.pick(5, 6));
+        do Point.nop(1, 2);
+        do Main.show(p.isSet());
+        let s = 0;
+        let i = 0;
+        while (i < 10) { do p.setX(i); let s = s + p.getX() + q.getX(); let i = i + 1; }
+        do Main.show(s);
+        do Main.show(p.dist2(q));
+        do Main.show(Point.counter());
+        return;
+    }
+}
+''',
+}
+
+
+def build(directory, optimizations):
+    """ Compiles the program in directory, returning (interpreter output, call sites inlined). """
+    compiler = JackCompiler(directory, use_cache=False, optimizations=optimizations)
+    errors = compiler.analyze()
+    if errors:
+        raise RuntimeError(errors)
+    interpreter = VMInterpreter.load(directory)
+    interpreter.run()
+    inlined = sum(stats.get('inlined', 0) for stats in compiler.stats.values())
+    return interpreter.output, inlined
+
+
+def main():
+    configurations = (
+        ("plain", ()),
+        ("inline", ('inline',)),
+        ("-O", DEFAULT_OPTIMIZATIONS),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, source in CLASSES.items():
+            with open(os.path.join(tmp, name + '.jack'), 'w') as f:
+                f.write(source)
+        baseline = None
+        for name, optimizations in configurations:
+            output, inlined = build(tmp, optimizations)
+            if baseline is None:
+                baseline = output
+            elif output != baseline:
+                lines = itertools.zip_longest(baseline.splitlines(), output.splitlines(), fillvalue='nothing')
+                line, (expected, got) = next((n, pair) for n, pair in enumerate(lines, 1) if pair[0] != pair[1])
+                print(f"  {name}: output line {line} is {got}, plain gives {expected}")
+                sys.exit(1)
+            print(f"  {name:>6}: same output, {inlined:>2} call sites inlined")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Correctness check for the 'strength' optimization (multiply and divide by
+constants lowered to add chains). A generated Jack program prints 'x * c',
+'c * x' and 'x / 1' for many factors c and operands x; it is compiled plain,
+with 'strength' alone and with -O, run on the VMInterpreter, and the printed
+output must be the same every time.
+
+The factors cover 0, +-1, powers of two, negatives, -32768 (never reduced)
+and the factors just inside and just outside MAX_MULTIPLY_CHAIN. The
+operands are a local, an array element, a parenthesized expression and a
+call with a side effect (which must still run exactly once per use), each
+with positive, negative, zero and extreme values.
+
+Usage: python benchmarks/check_strength.py
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from CompilationEngine import CompilationEngine, multiply_chain  # noqa: E402
+from JackCompiler import DEFAULT_OPTIMIZATIONS  # noqa: E402
+from VMCode import Instruction, PUSH, LOCAL  # noqa: E402
+from VMInterpreter import VMInterpreter  # noqa: E402
+
+VALUES = (0, 1, 7, -5, 181, -181, 32767, -32768)
+OPERANDS = ('x', 'a[1]', '(x + 3)', 'Main.side(x)')
+FIXED_FACTORS = (0, 1, -1, 2, 4, 8, 1024, 16384, -2, -8, -16384, 3, 5, 7, 10, 100, 255, 1000, -1000,
+                 32767, -32767, -32768)
+
+
+def cutoff_factors():
+    """
+    The largest positive and negative factors that still get an add chain
+    and the smallest ones that keep the Math.multiply call.
+    """
+    operand = [Instruction(PUSH, LOCAL, 0)]
+    factors = []
+    for sign in (1, -1):
+        reduced = [c for c in range(2, 32768) if multiply_chain(operand, sign * c) is not None]
+        kept = [c for c in range(2, 32768) if multiply_chain(operand, sign * c) is None]
+        factors += [sign * max(reduced), sign * min(kept)]
+    return tuple(factors)
+
+
+def jack_literal(value):
+    """ A Jack expression for value, which may be negative or -32768. """
+    if value == -32768:
+        return '(-32767 - 1)'
+    return f'(-{-value})' if value < 0 else str(value)
+
+
+def program(factors):
+    lines = [
+        "class Main {",
+        "    static int calls;",
+        "    function int side(int v) { let calls = calls + 1; return v; }",
+        "    function void main() {",
+        "        var int x;",
+        "        var Array a;",
+        "        let a = Array.new(2);",
+    ]
+    for value in VALUES:
+        lines.append(f"        let x = {jack_literal(value)};")
+        lines.append("        let a[1] = x;")
+        for operand in OPERANDS:
+            for factor in factors:
+                c = jack_literal(factor)
+                lines.append(f"        do Output.printInt({operand} * {c}); do Output.println();")
+                lines.append(f"        do Output.printInt({c} * {operand}); do Output.println();")
+            lines.append(f"        do Output.printInt({operand} / 1); do Output.println();")
+    lines += [
+        "        do Output.printInt(calls);",
+        "        return;",
+        "    }",
+        "}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def compile_program(source, optimizations):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'Main.jack')
+        with open(path, 'w') as f:
+            f.write(source)
+        engine = CompilationEngine(path, None, ir=True, optimizations=optimizations)
+        engine.compile_class()
+        engine.close()
+    return engine.vm_writer.functions
+
+
+def main():
+    factors = FIXED_FACTORS + cutoff_factors()
+    source = program(factors)
+    configurations = (
+        ("plain", ()),
+        ("strength", ('strength',)),
+        ("-O", DEFAULT_OPTIMIZATIONS),
+    )
+    print(f"{len(VALUES) * len(OPERANDS) * (2 * len(factors) + 1)} expressions, "
+          f"cutoff factors {', '.join(map(str, factors[len(FIXED_FACTORS):]))}")
+    baseline = None
+    for name, optimizations in configurations:
+        interpreter = VMInterpreter(compile_program(source, optimizations))
+        interpreter.run()
+        output = interpreter.output
+        multiplies = interpreter.counts().get('Math.multiply', {}).get('calls', 0)
+        if baseline is None:
+            baseline = output
+        elif output != baseline:
+            lines = itertools.zip_longest(baseline.splitlines(), output.splitlines(), fillvalue='nothing')
+            line, (expected, got) = next((n, pair) for n, pair in enumerate(lines, 1) if pair[0] != pair[1])
+            print(f"  {name}: output line {line} is {got}, plain gives {expected}")
+            sys.exit(1)
+        print(f"  {name:>8}: same output, {multiplies:>5} Math.multiply calls")
+
+
+if __name__ == "__main__":
+    main()
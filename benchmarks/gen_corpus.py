@@ -0,0 +1,190 @@
+"""
+Deterministic generator of synthetic Jack programs for benchmarking.
+The same profile and seed always give byte-identical files, so runs
+before and after a change compile the same input.
+
+Each class has fields, statics, a constructor, methods and functions whose
+bodies are random let/if/while/do statements over declared variables; one
+Main class calls into the others. The profiles stress different parts of
+the compiler: many small classes, very long subroutines, deeply nested
+expressions, and string-heavy code.
+
+Usage: python benchmarks/gen_corpus.py output_dir [profile] [--seed N]
+"""
+import argparse
+import os
+import random
+
+# classes: number of classes besides Main; subroutines: methods and
+# functions per class; statements: statements per subroutine body;
+# depth: nesting depth of generated expressions; strings: share of 'do'
+# statements that print a string literal
+PROFILES = {
+    'many-classes': dict(classes=300, subroutines=6, statements=12, depth=3, strings=0.2),
+    'long-subroutines': dict(classes=4, subroutines=2, statements=3000, depth=3, strings=0.2),
+    'deep-expressions': dict(classes=20, subroutines=4, statements=20, depth=12, strings=0.0),
+    'strings': dict(classes=20, subroutines=6, statements=60, depth=2, strings=0.9),
+}
+
+OPERATORS = ('+', '-', '*', '/', '&', '|', '<', '>', '=')
+WORDS = ('alpha', 'beta', 'gamma', 'delta', 'total', 'count', 'done', 'ready', 'value', 'x = ')
+
+
+class ClassGenerator:
+    """
+    Writes the source of one generated class.
+    """
+
+    def __init__(self, rng, name, n_classes, params):
+        """
+        :param rng: random.Random shared by the whole corpus
+        :param name: Class name
+        :param n_classes: Number of generated classes, for cross-class calls
+        :param params: One of PROFILES
+        """
+        self.rng = rng
+        self.name = name
+        self.n_classes = n_classes
+        self.params = params
+        self.lines = []
+        # int variables visible in the subroutine being written
+        self.variables = []
+
+    def source(self):
+        rng = self.rng
+        p = self.params
+        self.lines.append(f"/** Generated class {self.name}. */")
+        self.lines.append(f"class {self.name} {{")
+        self.lines.append("    field int x, y, z;")
+        self.lines.append("    static int count;  // instances made")
+        self.lines.append("")
+        self.lines.append(f"    constructor {self.name} new(int ax, int ay) {{")
+        self.lines.append("        let x = ax;")
+        self.lines.append("        let y = ay;")
+        self.lines.append("        let z = ax + ay;")
+        self.lines.append("        let count = count + 1;")
+        self.lines.append("        return this;")
+        self.lines.append("    }")
+        self.lines.append("")
+        self.lines.append("    method int getX() { return x; }")
+        self.lines.append("")
+        self.lines.append("    function int helper(int n) {")
+        self.lines.append("        return n + 1;")
+        self.lines.append("    }")
+        for i in range(p['subroutines']):
+            self.lines.append("")
+            if rng.random() < 0.5:
+                self.subroutine(f"method int work{i}(int n, int m)", ['n', 'm', 'x', 'y', 'z'])
+            else:
+                self.subroutine(f"function int calc{i}(int n, int m)", ['n', 'm'])
+        self.lines.append("}")
+        self.lines.append("")
+        return '\n'.join(self.lines)
+
+    def subroutine(self, header, variables):
+        self.lines.append(f"    /* {header.split('(')[0]}: generated body */")
+        self.lines.append(f"    {header} {{")
+        self.lines.append("        var int a, b, c;")
+        self.lines.append("        var Array buffer;")
+        self.lines.append("        let buffer = Array.new(8);")
+        self.variables = variables + ['a', 'b', 'c']
+        for _ in range(self.params['statements']):
+            self.statement(2)
+        self.lines.append("        do buffer.dispose();")
+        self.lines.append(f"        return {self.expression(1)};")
+        self.lines.append("    }")
+
+    def statement(self, indent):
+        rng = self.rng
+        pad = '    ' * indent
+        roll = rng.random()
+        if roll < 0.45:
+            self.lines.append(f"{pad}let {rng.choice(self.variables)} = {self.expression(self.params['depth'])};")
+        elif roll < 0.55:
+            self.lines.append(f"{pad}let buffer[{rng.randrange(8)}] = {self.expression(2)};  // array store")
+        elif roll < 0.65 and indent < 4:
+            self.lines.append(f"{pad}if ({self.condition()}) {{")
+            self.statement(indent + 1)
+            self.lines.append(f"{pad}}} else {{")
+            self.statement(indent + 1)
+            self.lines.append(f"{pad}}}")
+        elif roll < 0.72 and indent < 4:
+            counter = rng.choice(('a', 'b', 'c'))
+            self.lines.append(f"{pad}let {counter} = 0;")
+            self.lines.append(f"{pad}while ({counter} < {rng.randrange(2, 20)}) {{")
+            self.statement(indent + 1)
+            self.lines.append(f"{pad}    let {counter} = {counter} + 1;")
+            self.lines.append(f"{pad}}}")
+        elif rng.random() < self.params['strings']:
+            words = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(1, 5)))
+            self.lines.append(f'{pad}do Output.printString("{words}");')
+        else:
+            other = f"C{rng.randrange(self.n_classes)}"
+            self.lines.append(f"{pad}do Output.printInt({other}.helper({self.expression(2)}));")
+
+    def condition(self):
+        return f"{self.leaf()} {self.rng.choice(('<', '>', '='))} {self.expression(2)}"
+
+    def leaf(self):
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.5:
+            return rng.choice(self.variables)
+        if roll < 0.85:
+            return str(rng.randrange(0, 1000))
+        if roll < 0.95:
+            return f"buffer[{rng.randrange(8)}]"
+        return f"Math.abs({rng.choice(self.variables)})"
+
+    def expression(self, depth):
+        """ A chain of terms, some of them parenthesized expressions one level deeper. """
+        rng = self.rng
+        if depth <= 1:
+            return self.leaf()
+        left = f"({self.expression(depth - 1)})" if rng.random() < 0.5 else self.leaf()
+        if rng.random() < 0.1:
+            left = f"-{left}"
+        return f"{left} {rng.choice(OPERATORS)} {self.expression(depth - 1)}"
+
+
+def main_class(n_classes):
+    lines = ["class Main {", "    function void main() {", "        var int i;", "        let i = 0;"]
+    for k in range(min(n_classes, 50)):
+        lines.append(f"        let i = i + C{k}.helper({k});")
+    lines += ["        do Output.printInt(i);", "        return;", "    }", "}", ""]
+    return '\n'.join(lines)
+
+
+def generate(directory, profile='many-classes', seed=0):
+    """
+    Writes the corpus for a profile into directory (created if needed).
+    :return: The list of .jack paths written
+    """
+    params = PROFILES[profile]
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    sources = [('Main', main_class(params['classes']))]
+    for k in range(params['classes']):
+        sources.append((f"C{k}", ClassGenerator(rng, f"C{k}", params['classes'], params).source()))
+    for name, source in sources:
+        path = os.path.join(directory, name + '.jack')
+        with open(path, 'w') as f:
+            f.write(source)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Jack corpus.")
+    parser.add_argument('output_dir')
+    parser.add_argument('profile', nargs='?', choices=sorted(PROFILES), default='many-classes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = generate(args.output_dir, args.profile, args.seed)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"{len(paths)} files, {size / 1024:.0f} KB in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()